@@ -0,0 +1,465 @@
+"""
+خادم محلي بديل لـ API-FOOTBALL و Telegram Bot API لقياس البوت بدون استهلاك الحصة.
+
+- يوم مباريات اصطناعي بعدد مباريات جارية قابل للضبط (حتى 300+)،
+  كل مباراة تتقدم بساعة محاكاة وتولّد أهدافاً وبطاقات وتبديلات.
+- يعيد تشغيل ردود مسجلة (JSON) من مجلد --recordings إن وُجدت.
+- تلجرام: تأخير قابل للضبط + نسبة ردود 429 مع retry_after.
+- /_mock/stats: عدد الطلبات لكل endpoint، الرسائل، وتأخير التنبيهات.
+
+تشغيل مستقل:
+    python bench/mock_server.py --fixtures 300 --port 8099
+ثم:
+    API_FOOTBALL_BASE=http://127.0.0.1:8099 TELEGRAM_API_BASE=http://127.0.0.1:8099 python main.py
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+# أرقام وأسماء بعض الفرق الكبيرة حتى تُختبر مسارات VIP
+VIP_TEAMS = [
+    (541, "Real Madrid"),
+    (529, "Barcelona"),
+    (50, "Manchester City"),
+    (40, "Liverpool"),
+    (157, "Bayern München"),
+    (2939, "Al-Nassr"),
+]
+
+LEAGUES = [(39, "Premier League"), (140, "La Liga"), (135, "Serie A"),
+           (78, "Bundesliga"), (61, "Ligue 1"), (2, "UEFA Champions League")]
+
+# خط زمني بدقائق المحاكاة: 0-45 شوط أول، 45-60 استراحة، 60-105 شوط ثانٍ
+HALF_TIME_START = 45
+SECOND_HALF_START = 60
+FULL_TIME = 105
+
+PLAYER_TOKEN = re.compile(r"P(\d+)-(\d+)")
+
+
+def iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S+00:00")
+
+
+class SimFixture:
+    """مباراة اصطناعية: أحداثها مولّدة مسبقاً وتظهر حسب ساعة المحاكاة."""
+
+    def __init__(self, fixture_id: int, home: tuple, away: tuple, league: tuple,
+                 start: float, speed: float, rng: random.Random):
+        self.id = fixture_id
+        self.home = home
+        self.away = away
+        self.league = league
+        self.start = start            # وقت حقيقي يقابل الدقيقة 0
+        self.speed = speed            # دقائق محاكاة لكل ثانية حقيقية
+        self.events = []              # (sim_minute, event dict)
+        n = 0
+        for _ in range(rng.randint(6, 16)):
+            minute = rng.randint(1, 90)
+            sim_minute = minute if minute <= 45 else minute + (SECOND_HALF_START - 45)
+            side = rng.choice((home, away))
+            n += 1
+            kind = rng.choices(["Goal", "Card", "subst"], weights=[3, 4, 5])[0]
+            detail = {
+                "Goal": "Normal Goal",
+                "Card": rng.choice(["Yellow Card", "Yellow Card", "Red Card"]),
+                "subst": f"Substitution {n}",
+            }[kind]
+            self.events.append((sim_minute, {
+                "time": {"elapsed": minute, "extra": None},
+                "team": {"id": side[0], "name": side[1]},
+                "player": {"id": fixture_id * 100 + n, "name": f"P{fixture_id}-{n}"},
+                "assist": {"id": None, "name": None},
+                "type": kind,
+                "detail": detail,
+            }))
+        self.events.sort(key=lambda e: e[0])
+
+    def sim_minute(self, now: float) -> float:
+        return (now - self.start) * self.speed
+
+    def visible_at(self, sim_minute: float) -> float:
+        """الوقت الحقيقي الذي يظهر فيه حدث بهذه الدقيقة."""
+        return self.start + sim_minute / self.speed
+
+    def status(self, now: float) -> tuple[str, str, int | None]:
+        m = self.sim_minute(now)
+        if m < 0:
+            return "NS", "Not Started", None
+        if m < HALF_TIME_START:
+            return "1H", "First Half", int(m)
+        if m < SECOND_HALF_START:
+            return "HT", "Halftime", 45
+        if m < FULL_TIME:
+            return "2H", "Second Half", int(m - (SECOND_HALF_START - 45))
+        return "FT", "Match Finished", 90
+
+    def visible_events(self, now: float) -> list[dict]:
+        m = self.sim_minute(now)
+        return [ev for sim_m, ev in self.events if sim_m <= m]
+
+    def payload(self, now: float) -> dict:
+        short, long_, elapsed = self.status(now)
+        goals = {"home": None, "away": None}
+        if short != "NS":
+            goals = {"home": 0, "away": 0}
+            for ev in self.visible_events(now):
+                if ev["type"] == "Goal":
+                    goals["home" if ev["team"]["id"] == self.home[0] else "away"] += 1
+        return {
+            "fixture": {
+                "id": self.id,
+                "date": iso(self.start),
+                "timezone": "UTC",
+                "venue": {"id": None, "name": "Mock Stadium", "city": "Mock City"},
+                "status": {"long": long_, "short": short, "elapsed": elapsed},
+            },
+            "league": {"id": self.league[0], "name": self.league[1], "country": "Mock",
+                       "season": datetime.utcnow().year},
+            "teams": {
+                "home": {"id": self.home[0], "name": self.home[1],
+                         "logo": f"https://media.example/teams/{self.home[0]}.png"},
+                "away": {"id": self.away[0], "name": self.away[1],
+                         "logo": f"https://media.example/teams/{self.away[0]}.png"},
+            },
+            "goals": goals,
+            "score": {"halftime": {"home": None, "away": None}},
+        }
+
+    def statistics(self) -> list[dict]:
+        return [
+            {"team": {"id": side[0], "name": side[1]},
+             "statistics": [{"type": "Shots on Goal", "value": 3},
+                            {"type": "Total Shots", "value": 9},
+                            {"type": "Ball Possession", "value": "50%"}]}
+            for side in (self.home, self.away)
+        ]
+
+
+class MockState:
+    def __init__(self, live: int, upcoming: int, speed: float, seed: int,
+                 recordings: str | None):
+        self.lock = threading.Lock()
+        self.recordings = recordings
+        self.rng = random.Random(seed)
+        self.speed = speed
+        self.api_latency = 0.0
+        self.tg_latency = 0.0
+        self.tg_429_rate = 0.0
+        self.tg_retry_after = 1
+        self.daily_limit = 7500
+        self.fixtures: dict[int, SimFixture] = {}
+        self._build(live, upcoming)
+        self.reset_counters()
+
+    def _build(self, live: int, upcoming: int):
+        now = time.time()
+        teams = [(10000 + i, f"Team {i}") for i in range(2 * (live + upcoming))]
+        for i, vip in enumerate(VIP_TEAMS[: min(len(VIP_TEAMS), live)]):
+            teams[2 * i] = vip
+        for i in range(live + upcoming):
+            fid = 900000 + i
+            if i < live:
+                # مباريات جارية بمراحل مختلفة (بداية، استراحة، نهاية...)
+                start = now - self.rng.uniform(0, FULL_TIME - 5) / self.speed
+            else:
+                start = now + self.rng.uniform(5, 60 * 24 * 3) / self.speed
+            self.fixtures[fid] = SimFixture(
+                fid, teams[2 * i], teams[2 * i + 1], LEAGUES[i % len(LEAGUES)],
+                start, self.speed, self.rng,
+            )
+
+    def reset_counters(self):
+        with self.lock:
+            self.api_calls = Counter()
+            self.api_total = 0
+            self.tg_calls = Counter()
+            self.messages: list[tuple[float, str]] = []
+            self.rate_limited = 0
+            self.alert_delays: list[float] = []
+            self.alerted: set[str] = set()
+            self.next_message_id = 1
+            # التأخير يُقاس فقط للأحداث التي ظهرت بعد هذه اللحظة
+            self.measure_from = time.time()
+
+    # ---- ردود مسجلة ----
+    def recorded(self, name: str):
+        if not self.recordings:
+            return None
+        path = os.path.join(self.recordings, name + ".json")
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+
+    def note_message(self, text: str):
+        now = time.time()
+        with self.lock:
+            self.messages.append((now, text))
+            for fid, n in PLAYER_TOKEN.findall(text or ""):
+                token = f"{fid}-{n}"
+                if token in self.alerted:
+                    continue
+                fx = self.fixtures.get(int(fid))
+                if not fx or int(n) > len(fx.events):
+                    continue
+                self.alerted.add(token)
+                sim_minute = next(
+                    (m for m, ev in fx.events if ev["player"]["name"] == f"P{token}"), None
+                )
+                if sim_minute is not None and fx.visible_at(sim_minute) >= self.measure_from:
+                    self.alert_delays.append(max(0.0, now - fx.visible_at(sim_minute)))
+
+
+def percentile(values: list[float], p: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(p / 100.0 * (len(values) - 1)))))
+    return values[k]
+
+
+def create_app(state: MockState) -> Flask:
+    app = Flask("mock_server")
+
+    def api_reply(payload: dict, endpoint: str):
+        with state.lock:
+            state.api_calls[endpoint] += 1
+            state.api_total += 1
+            remaining = max(0, state.daily_limit - state.api_total)
+        if state.api_latency:
+            time.sleep(state.api_latency)
+        resp = jsonify(payload)
+        resp.headers["x-ratelimit-requests-limit"] = str(state.daily_limit)
+        resp.headers["x-ratelimit-requests-remaining"] = str(remaining)
+        resp.headers["X-RateLimit-Limit"] = "300"
+        resp.headers["X-RateLimit-Remaining"] = "299"
+        return resp
+
+    def envelope(endpoint: str, response: list, params: dict | None = None) -> dict:
+        return {"get": endpoint, "parameters": params or {}, "errors": [],
+                "results": len(response), "paging": {"current": 1, "total": 1},
+                "response": response}
+
+    @app.get("/fixtures")
+    def fixtures():
+        now = time.time()
+        args = request.args
+        if args.get("live"):
+            rec = state.recorded("fixtures_live")
+            if rec is not None:
+                return api_reply(rec, "/fixtures?live")
+            items = [fx.payload(now) for fx in state.fixtures.values()
+                     if fx.status(now)[0] in ("1H", "HT", "2H")]
+            return api_reply(envelope("fixtures", items, dict(args)), "/fixtures?live")
+
+        if args.get("ids"):
+            ids = [int(x) for x in args["ids"].split("-") if x.strip()][:20]
+            items = []
+            for fid in ids:
+                fx = state.fixtures.get(fid)
+                if not fx:
+                    continue
+                item = fx.payload(now)
+                item["events"] = fx.visible_events(now)
+                item["statistics"] = fx.statistics()
+                item["lineups"] = []
+                items.append(item)
+            return api_reply(envelope("fixtures", items, dict(args)), "/fixtures?ids")
+
+        rec = state.recorded("fixtures_next")
+        if rec is not None:
+            return api_reply(rec, "/fixtures?next")
+        upcoming = sorted(
+            (fx for fx in state.fixtures.values() if fx.start > now), key=lambda fx: fx.start
+        )
+        if args.get("team"):
+            team = int(args["team"])
+            upcoming = [fx for fx in upcoming if team in (fx.home[0], fx.away[0])]
+        if args.get("league"):
+            league = int(args["league"])
+            upcoming = [fx for fx in upcoming if fx.league[0] == league]
+        limit = int(args.get("next", 50))
+        items = [fx.payload(now) for fx in upcoming[:limit]]
+        kind = "/fixtures?team" if args.get("team") else (
+            "/fixtures?league" if args.get("league") else "/fixtures?next")
+        return api_reply(envelope("fixtures", items, dict(args)), kind)
+
+    @app.get("/fixtures/events")
+    def fixture_events():
+        fid = int(request.args.get("fixture", 0))
+        rec = state.recorded(f"fixtures_events_{fid}")
+        if rec is not None:
+            return api_reply(rec, "/fixtures/events")
+        fx = state.fixtures.get(fid)
+        items = fx.visible_events(time.time()) if fx else []
+        return api_reply(envelope("fixtures/events", items), "/fixtures/events")
+
+    @app.get("/fixtures/statistics")
+    def fixture_statistics():
+        fid = int(request.args.get("fixture", 0))
+        rec = state.recorded(f"fixtures_statistics_{fid}")
+        if rec is not None:
+            return api_reply(rec, "/fixtures/statistics")
+        fx = state.fixtures.get(fid)
+        return api_reply(envelope("fixtures/statistics", fx.statistics() if fx else []),
+                         "/fixtures/statistics")
+
+    @app.get("/players/topscorers")
+    def topscorers():
+        league = int(request.args.get("league", 0))
+        rec = state.recorded(f"players_topscorers_{league}")
+        if rec is not None:
+            return api_reply(rec, "/players/topscorers")
+        name = dict(LEAGUES).get(league, f"League {league}")
+        items = [{
+            "player": {"id": league * 100 + i, "name": f"Scorer {league}-{i}"},
+            "statistics": [{"team": {"id": 1, "name": f"Club {i}"},
+                            "league": {"id": league, "name": name},
+                            "goals": {"total": 20 - i}}],
+        } for i in range(10)]
+        return api_reply(envelope("players/topscorers", items), "/players/topscorers")
+
+    @app.get("/teams")
+    def teams():
+        search = (request.args.get("search") or "").lower()
+        seen = {}
+        for fx in state.fixtures.values():
+            for tid, name in (fx.home, fx.away):
+                if search and search in name.lower():
+                    seen[tid] = name
+        items = [{"team": {"id": tid, "name": name}} for tid, name in seen.items()]
+        return api_reply(envelope("teams", items), "/teams")
+
+    @app.get("/leagues")
+    def leagues():
+        league = int(request.args.get("id", 0))
+        year = datetime.utcnow().year
+        items = [{"league": {"id": league, "name": dict(LEAGUES).get(league, "League")},
+                  "seasons": [{"year": year, "current": True,
+                               "start": f"{year}-08-01", "end": f"{year + 1}-05-31"}]}]
+        return api_reply(envelope("leagues", items), "/leagues")
+
+    @app.post("/bot<token>/<method>")
+    def telegram(token: str, method: str):
+        if state.tg_latency:
+            time.sleep(state.tg_latency)
+        with state.lock:
+            state.tg_calls[method] += 1
+            limited = state.rng.random() < state.tg_429_rate
+            if limited:
+                state.rate_limited += 1
+            else:
+                message_id = state.next_message_id
+                state.next_message_id += 1
+        if limited:
+            return jsonify({"ok": False, "error_code": 429,
+                            "description": "Too Many Requests: retry later",
+                            "parameters": {"retry_after": state.tg_retry_after}}), 429
+
+        data = request.form.to_dict() or (request.get_json(silent=True) or {})
+        text = data.get("text") or data.get("caption") or ""
+        if method in ("sendMessage", "sendPhoto", "editMessageText", "editMessageCaption"):
+            state.note_message(text)
+        result = {"message_id": int(data.get("message_id") or message_id),
+                  "date": int(time.time()), "chat": {"id": data.get("chat_id")}, "text": text}
+        if method == "sendPhoto":
+            photo = data.get("photo", "")
+            result["photo"] = [{"file_id": f"file-{abs(hash(photo)) % 10**8}-s", "width": 90},
+                               {"file_id": f"file-{abs(hash(photo)) % 10**8}", "width": 320}]
+        return jsonify({"ok": True, "result": result})
+
+    @app.get("/_mock/stats")
+    def mock_stats():
+        return jsonify(snapshot(state))
+
+    @app.post("/_mock/reset")
+    def mock_reset():
+        state.reset_counters()
+        return jsonify({"ok": True})
+
+    return app
+
+
+def snapshot(state: MockState) -> dict:
+    with state.lock:
+        delays = list(state.alert_delays)
+        return {
+            "api_calls": dict(state.api_calls),
+            "api_total": state.api_total,
+            "telegram_calls": dict(state.tg_calls),
+            "messages": len(state.messages),
+            "rate_limited": state.rate_limited,
+            "alerts": len(delays),
+            "alert_delay_p50": percentile(delays, 50),
+            "alert_delay_p90": percentile(delays, 90),
+            "alert_delay_p99": percentile(delays, 99),
+        }
+
+
+class MockServer:
+    """تشغيل الخادم في خيط خلفي (للاستخدام من سكربت القياس)."""
+
+    def __init__(self, state: MockState, host: str = "127.0.0.1", port: int = 0):
+        self.state = state
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        self._server = make_server(host, port, create_app(state), threaded=True)
+        self.port = self._server.server_port
+        self.base_url = f"http://{host}:{self.port}"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def start(self) -> "MockServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+
+
+def add_state_args(parser: argparse.ArgumentParser):
+    parser.add_argument("--fixtures", type=int, default=300, help="عدد المباريات الجارية")
+    parser.add_argument("--upcoming", type=int, default=200, help="عدد المباريات القادمة")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="دقائق محاكاة لكل ثانية حقيقية")
+    parser.add_argument("--seed", type=int, default=90)
+    parser.add_argument("--recordings", help="مجلد ردود JSON مسجلة لإعادة تشغيلها")
+    parser.add_argument("--api-latency", type=float, default=0.05)
+    parser.add_argument("--tg-latency", type=float, default=0.05)
+    parser.add_argument("--tg-429-rate", type=float, default=0.0)
+    parser.add_argument("--tg-retry-after", type=int, default=1)
+
+
+def state_from_args(args) -> MockState:
+    state = MockState(args.fixtures, args.upcoming, args.speed, args.seed, args.recordings)
+    state.api_latency = args.api_latency
+    state.tg_latency = args.tg_latency
+    state.tg_429_rate = args.tg_429_rate
+    state.tg_retry_after = args.tg_retry_after
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_state_args(parser)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    args = parser.parse_args()
+    server = MockServer(state_from_args(args), args.host, args.port)
+    print(f"🧪 Mock API-FOOTBALL + Telegram on {server.base_url}")
+    server._server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
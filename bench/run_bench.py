@@ -0,0 +1,154 @@
+"""
+قياس أداء البوت مقابل الخادم المحلي البديل (bench/mock_server.py).
+
+يشغّل process_live_fixtures لعدد من الدورات ومهام الجداول مرة واحدة،
+ثم يطبع: زمن الدورة، طلبات API لكل دورة، الرسائل المرسلة،
+ونسب تأخير التنبيهات (p50/p90/p99) من لحظة ظهور الحدث حتى وصوله لتلجرام.
+
+مثال:
+    python bench/run_bench.py --fixtures 300 --ticks 10 --tick-interval 5
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+sys.path.insert(0, os.path.dirname(HERE))
+
+from mock_server import MockServer, add_state_args, percentile, snapshot, state_from_args  # noqa: E402
+
+
+def load_bot(base_url: str, state_dir: str):
+    """استيراد main.py موجهاً للخادم البديل (المتغيرات تُقرأ عند الاستيراد)."""
+    os.environ["API_FOOTBALL_BASE"] = base_url
+    os.environ["TELEGRAM_API_BASE"] = base_url
+    os.environ.setdefault("BOT_TOKEN", "bench-token")
+    os.environ.setdefault("API_FOOTBALL_KEY", "bench-key")
+    os.environ["STATE_DB_PATH"] = os.path.join(state_dir, "bench_state.db")
+    import main as bot
+    bot.init_state()
+    return bot
+
+
+def wait_for_outbox(bot, timeout: float):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if bot.tg_outbox.stats_snapshot()["queued"] == 0:
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def run(args) -> dict:
+    state = state_from_args(args)
+    server = MockServer(state).start()
+    with tempfile.TemporaryDirectory() as state_dir:
+        bot = load_bot(server.base_url, state_dir)
+        if args.tg_per_minute:
+            bot.tg_outbox.min_interval = 60.0 / args.tg_per_minute
+        if args.shards > 1:
+            bot.shard_coordinator = bot.ShardCoordinator(args.shards, bot.STATE_DB_PATH)
+
+        ticks = []
+        for i in range(args.ticks):
+            before = snapshot(state)["api_total"]
+            start = time.perf_counter()
+            next_interval = bot.process_live_fixtures()
+            latency = time.perf_counter() - start
+            ticks.append({
+                "tick": i,
+                "latency": latency,
+                "api_calls": snapshot(state)["api_total"] - before,
+                "next_interval": next_interval,
+            })
+            if i + 1 < args.ticks:
+                time.sleep(args.tick_interval)
+
+        jobs = {}
+        if not args.skip_jobs:
+            for name in ("send_global_schedule", "send_favorites_schedule",
+                         "send_top_scorers", "send_match_of_week"):
+                before = snapshot(state)["api_total"]
+                start = time.perf_counter()
+                getattr(bot, name)()
+                jobs[name] = {"latency": time.perf_counter() - start,
+                              "api_calls": snapshot(state)["api_total"] - before}
+
+        if bot.shard_coordinator:
+            bot.shard_coordinator.stop()
+        drained = wait_for_outbox(bot, args.drain_seconds)
+        mock = snapshot(state)
+        if bot.state_store:
+            bot.state_store.commit()
+
+    server.stop()
+    latencies = [t["latency"] for t in ticks]
+    calls = [t["api_calls"] for t in ticks]
+    return {
+        "fixtures": args.fixtures,
+        "shards": args.shards,
+        "ticks": ticks,
+        "tick_latency_p50": percentile(latencies, 50),
+        "tick_latency_p90": percentile(latencies, 90),
+        "tick_latency_max": max(latencies) if latencies else None,
+        "api_calls_per_tick_avg": sum(calls) / len(calls) if calls else None,
+        "api_calls_first_tick": calls[0] if calls else None,
+        "api_calls_steady_avg": sum(calls[1:]) / len(calls[1:]) if len(calls) > 1 else None,
+        "jobs": jobs,
+        "outbox_drained": drained,
+        "outbox": bot.tg_outbox.stats_snapshot(),
+        "mock": mock,
+    }
+
+
+def print_report(res: dict):
+    fmt = lambda v: "-" if v is None else (f"{v:.3f}" if isinstance(v, float) else str(v))
+    print(f"\n📊 Bench: {res['fixtures']} live fixtures, {len(res['ticks'])} ticks")
+    print("tick  latency(s)  api_calls  next_interval(s)")
+    for t in res["ticks"]:
+        print(f"{t['tick']:>4}  {t['latency']:>10.3f}  {t['api_calls']:>9}  {fmt(t['next_interval']):>16}")
+    print(f"tick latency p50/p90/max: {fmt(res['tick_latency_p50'])} / "
+          f"{fmt(res['tick_latency_p90'])} / {fmt(res['tick_latency_max'])}")
+    print(f"api calls/tick: first {fmt(res['api_calls_first_tick'])}, "
+          f"steady avg {fmt(res['api_calls_steady_avg'])}")
+    for name, job in res["jobs"].items():
+        print(f"{name}: {job['latency']:.3f}s, {job['api_calls']} api calls")
+    mock = res["mock"]
+    print(f"messages delivered: {mock['messages']} (telegram calls {mock['telegram_calls']}, "
+          f"429s {mock['rate_limited']})")
+    print(f"outbox: {res['outbox']} drained={res['outbox_drained']}")
+    print(f"alert delay p50/p90/p99 (s): {fmt(mock['alert_delay_p50'])} / "
+          f"{fmt(mock['alert_delay_p90'])} / {fmt(mock['alert_delay_p99'])} "
+          f"over {mock['alerts']} alerts")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_state_args(parser)
+    parser.add_argument("--ticks", type=int, default=5)
+    parser.add_argument("--tick-interval", type=float, default=2.0,
+                        help="ثوانٍ حقيقية بين الدورات (بدل LIVE_POLL_SECONDS)")
+    parser.add_argument("--tg-per-minute", type=float, default=6000,
+                        help="سرعة طابور تلجرام أثناء القياس (0 = إعداد البوت)")
+    parser.add_argument("--drain-seconds", type=float, default=30)
+    parser.add_argument("--shards", type=int, default=1,
+                        help="عدد عمليات اللايف (وضع ShardCoordinator)")
+    parser.add_argument("--skip-jobs", action="store_true", help="بدون مهام الجداول")
+    parser.add_argument("--json", action="store_true", help="إخراج JSON")
+    args = parser.parse_args()
+
+    res = run(args)
+    if args.json:
+        print(json.dumps(res, ensure_ascii=False, indent=2, default=str))
+    else:
+        print_report(res)
+
+
+if __name__ == "__main__":
+    main()
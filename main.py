@@ -1,9 +1,37 @@
+import hashlib
+import heapq
+import html
+import itertools
+import json
+import multiprocessing
 import os
+import random
+import re
+import sqlite3
+import sys
+import threading
 import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timedelta, timezone
+from queue import Empty
+from types import SimpleNamespace
 
 import requests
-from flask import Flask
+from flask import Flask, Response, jsonify
+from flask import request as flask_request
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import ijson
+except ImportError:  # بدون ijson نقرأ الرد كاملاً ثم نختصره
+    ijson = None
+
+try:
+    import numpy as np
+except ImportError:  # بدون numpy يبقى التوقع البسيط (simple_predict)
+    np = None
 
 # ============================
 #   إعدادات أساسية (Env Vars)
@@ -11,8 +39,22 @@ from flask import Flask
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 CHAT_ID = os.getenv("CHAT_ID", "@F90Sports")
+# قنوات إضافية بفلاتر (JSON)، مثال:
+# [{"chat_id": "@F90Sports"},
+#  {"chat_id": "@F90VIP", "teams": "favorites"},
+#  {"chat_id": "@F90PL", "leagues": [39], "events": ["goal", "status"]}]
+# بدونها: قناة واحدة CHAT_ID تستقبل كل شيء.
+CHANNELS_JSON = os.getenv("CHANNELS")
+
+# أوامر تلجرام عبر Webhook على نفس تطبيق Flask (بدون TG_WEBHOOK_URL لا يُسجَّل شيء)
+TG_WEBHOOK_URL = os.getenv("TG_WEBHOOK_URL")          # مثال: https://f90.onrender.com/telegram
+TG_WEBHOOK_SECRET = os.getenv("TG_WEBHOOK_SECRET", "")
 API_FOOTBALL_KEY = os.getenv("API_FOOTBALL_KEY")
 
+# عناوين المزودين (قابلة للتغيير لخادم محلي بديل أثناء القياس)
+API_FOOTBALL_BASE = os.getenv("API_FOOTBALL_BASE", "https://v3.football.api-sports.io")
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org")
+
 if not BOT_TOKEN or not API_FOOTBALL_KEY:
     print("❌ BOT_TOKEN أو API_FOOTBALL_KEY غير مضبوطين في Environment Variables!")
 
@@ -20,12 +62,92 @@ if not BOT_TOKEN or not API_FOOTBALL_KEY:
 TZ_OFFSET = 2
 
 # إعدادات تكرار
-LIVE_POLL_SECONDS = 60             # فحص لايف كل 60 ثانية
+LIVE_POLL_SECONDS = 60             # فحص لايف كل 60 ثانية (الإيقاع العادي)
 SCHEDULE_EVERY_SECONDS = 1800      # نشر جدول كل 30 دقيقة
-TOPSCORERS_EVERY_SECONDS = 12 * 3600
+TOPSCORERS_EVERY_SECONDS = 3600    # يُنشر فقط ما تغيّر، والجلب حسب TTL أيام المباريات
 MATCH_OF_WEEK_EVERY_SECONDS = 12 * 3600
 FAVORITES_EVERY_SECONDS = 1800     # جدول خاص للفرق الكبيرة كل 30 دقيقة
 
+# فحص لايف متكيّف مع مرحلة المباريات
+LIVE_POLL_FAST_SECONDS = 20        # دقائق أخيرة / أشواط إضافية / ركلات ترجيح
+LIVE_POLL_SLOW_SECONDS = 180       # كل المباريات الجارية في الاستراحة
+IDLE_POLL_MAX_SECONDS = 1800       # أقصى نوم حين لا توجد مباريات
+KICKOFF_LEAD_SECONDS = 120         # نصحو قبل أقرب انطلاقة بهذه المدة
+LATE_PHASE_MINUTE = 80             # من هنا يعتبر الشوط الثاني "متأخراً"
+EVENTS_SAFETY_REFRESH_SECONDS = 300  # جلب أحداث مباراة بلا تغيير كل 5 دقائق (بطاقات/تبديلات)
+EVENTS_HOT_SECONDS = 180           # بعد أي تغيير نتابع الأحداث كل دورة لهذه المدة
+API_DAILY_REQUEST_BUDGET = int(os.getenv("API_DAILY_REQUEST_BUDGET", "7500"))
+
+# حوكمة حصة API-FOOTBALL: أولويات الطلبات (الأصغر أهم)
+API_PRIORITY_LIVE = 0              # نتائج اللايف
+API_PRIORITY_FAV_EVENTS = 1        # أحداث مباريات الفرق المفضلة
+API_PRIORITY_EVENTS = 2            # أحداث/إحصائيات باقي المباريات
+API_PRIORITY_BACKGROUND = 3        # الجداول والهدافين والبحث
+QUOTA_PER_MINUTE_DEFAULT = 30      # حتى تصل ترويسات X-RateLimit-*
+# أقل نسبة متبقية (يومية / من دلو الدقيقة) يحتاجها كل مستوى؛ تحتها يُؤجَّل الطلب
+QUOTA_DAILY_RESERVE = {0: 0.0, 1: 0.03, 2: 0.10, 3: 0.25}
+QUOTA_MINUTE_RESERVE = {0: 0.0, 1: 0.10, 2: 0.25, 3: 0.50}
+QUOTA_LIVE_WAIT_SECONDS = 5        # طلبات اللايف تنتظر توكن بدل التأجيل
+
+# مهام الخلفية: أقصى مدة متوقعة لكل تشغيل + تذبذب عشوائي لتوزيع الطلبات
+BACKGROUND_JOB_DEADLINE_SECONDS = 300
+BACKGROUND_JOB_JITTER_SECONDS = 30
+
+# جلب أحداث/إحصائيات المباريات الجارية بالتوازي
+LIVE_FETCH_CONCURRENCY = 8         # أقصى عدد طلبات متزامنة
+LIVE_TICK_DEADLINE_SECONDS = 40    # مهلة الجلب في كل دورة لايف
+FIXTURE_IDS_BATCH = 20             # حد /fixtures?ids=a-b-c (أحداث + إحصائيات + تشكيلات)
+
+# اتصالات HTTP مشتركة (keep-alive + إعادة محاولة)
+HTTP_API_POOL_SIZE = 16            # ≥ LIVE_FETCH_CONCURRENCY
+HTTP_TG_POOL_SIZE = 4
+HTTP_MAX_RETRIES = 3
+HTTP_BACKOFF_FACTOR = 0.5          # 0.5، 1، 2 ثانية...
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)   # لطلبات API-FOOTBALL فقط
+
+# كاش ردود API-FOOTBALL (ثوانٍ لكل endpoint)
+API_CACHE_MAX_ENTRIES = 256
+API_CACHE_TTLS = {
+    "/fixtures": 300,                  # fixtures?next=N
+    "/players/topscorers": 6 * 3600,
+}
+NEXT_FIXTURES_WINDOW = 200         # طلب next واحد يخدم كل الحدود الأصغر
+
+# الهدافون: صلاحية الكاش حسب أيام مباريات الدوري
+TOPSCORERS_MATCHDAY_TTL = 1800     # مباراة جارية أو انتهت للتو
+TOPSCORERS_MIN_TTL = 3600
+TOPSCORERS_MAX_TTL = 24 * 3600
+TOPSCORERS_AFTER_KICKOFF = 2 * 3600  # نحدّث بعد انتهاء أقرب مباراة للدوري
+TOPSCORERS_TOP_N = 5
+
+# الجداول: تعديل الرسالة السابقة إن تغيّر جزء من مبارياتها فقط
+SCHEDULE_EDIT_MAX_CHANGED_RATIO = 0.5
+
+# فلترة من السيرفر (team=/league=) بدل مسح next=200 عالمياً
+SERVER_SIDE_FILTERS = True
+TEAM_NEXT_FIXTURES = 1             # أقرب مباراة لكل فريق VIP
+LEAGUE_NEXT_FIXTURES = 10          # أقرب مباريات كل دوري مهم
+
+# طابور تلجرام
+TG_MAX_MESSAGES_PER_MINUTE = 20    # حد تلجرام التقريبي للقناة/المجموعة
+TG_QUEUE_MAX_SIZE = 2000
+TG_MESSAGE_LIMIT = 4096
+MEDIA_CACHE_MAX_ENTRIES = 500      # file_id لشعارات/صور أُرسلت سابقاً (LRU على القرص)
+
+# أولويات الإرسال (الأصغر أولاً)
+PRIORITY_HIGH = 0                  # أهداف + نهاية المباراة
+PRIORITY_NORMAL = 1                # انطلاق، استراحة، بطاقات، تنبيهات
+PRIORITY_LOW = 2                   # تبديلات
+
+# حالة دائمة بين مرات التشغيل
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "f90_state.db")
+STATE_RETENTION_SECONDS = 6 * 3600  # حذف حالة المباراة بعد غيابها عن اللايف بهذه المدة
+
+# تقسيم متابعة اللايف على عدة عمليات (1 = عملية واحدة)
+LIVE_SHARDS = int(os.getenv("LIVE_SHARDS", "1"))
+LIVE_SHARD_KEY = os.getenv("LIVE_SHARD_KEY", "fixture")   # fixture أو league
+SHARD_ACK_TIMEOUT_SECONDS = LIVE_TICK_DEADLINE_SECONDS + 10
+
 # دوريات مهمة (IDs من API-FOOTBALL)
 IMPORTANT_LEAGUES = [
     39,   # Premier League
@@ -52,66 +174,960 @@ FAVORITE_TEAMS = [
     "Al Ittihad",
 ]
 
+# أرقام الفرق في API-FOOTBALL (المطابقة بالرقم أولاً)
+FAVORITE_TEAM_IDS = {
+    541: "Real Madrid",
+    529: "Barcelona",
+    50: "Manchester City",
+    40: "Liverpool",
+    49: "Chelsea",
+    157: "Bayern Munich",
+    85: "Paris Saint Germain",
+    2939: "Al Nassr",
+    2932: "Al Hilal",
+    2938: "Al Ittihad",
+}
+
+# أسماء بديلة (عربي/لاتيني) للمطابقة بالاسم حين لا يتوفر الرقم
+TEAM_ALIASES = {
+    "Real Madrid": ["ريال مدريد"],
+    "Barcelona": ["برشلونة"],
+    "Manchester City": ["Man City", "مانشستر سيتي"],
+    "Liverpool": ["ليفربول"],
+    "Chelsea": ["تشيلسي"],
+    "Bayern Munich": ["Bayern München", "Bayern Munchen", "بايرن ميونخ"],
+    "Paris Saint Germain": ["Paris Saint-Germain", "PSG", "باريس سان جيرمان"],
+    "Al Nassr": ["Al-Nassr", "النصر"],
+    "Al Hilal": ["Al-Hilal", "الهلال"],
+    "Al Ittihad": ["Al-Ittihad", "اتحاد جدة"],
+}
+
+# الفرق التي يرجّحها التوقع البسيط
+PREDICT_BIG_CLUBS = {
+    "Real Madrid",
+    "Barcelona",
+    "Manchester City",
+    "Bayern Munich",
+    "Liverpool",
+    "Al Nassr",
+    "Al Hilal",
+    "Al Ittihad",
+}
+
+# محرك التوقع (Poisson). التقييمات تُحسب دون اتصال:
+#   python main.py --fit-ratings [--backfill]
+PREDICT_RATINGS_PATH = os.getenv("PREDICT_RATINGS_PATH", "f90_ratings.json")
+PREDICT_MAX_GOALS = 10
+PREDICT_DEFAULT_MU = 0.3           # log متوسط أهداف الفريق في المباراة (~1.35)
+PREDICT_DEFAULT_HOME = 0.25        # أفضلية الأرض (log)
+PREDICT_BIG_CLUB_PRIOR = 0.3       # قوة افتراضية لفرق PREDICT_BIG_CLUBS بلا تقييم
+PREDICT_FIT_HALF_LIFE_DAYS = 180   # وزن النتيجة يتناصف كل 180 يوماً
+PREDICT_FIT_PRIOR_GOALS = 3.0      # يشد الفرق قليلة المباريات نحو المتوسط
+PREDICT_FIT_ITERATIONS = 100
+
+# ============================
+#   مقاييس (بصيغة Prometheus)
+# ============================
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 60)
+
+
+def _labels_text(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{str(v).replace(chr(34), chr(39))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """أساس بسيط لمقياس بتسميات (labels) وقيم محفوظة في الذاكرة."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, doc: str, labelnames: tuple = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = labelnames
+        self._values: dict = {}
+        self._lock = threading.Lock()
+        metrics_registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_labels_text(self.labelnames, key)} {value}")
+        return lines
+
+
+class CounterMetric(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class GaugeMetric(Metric):
+    """قيمة لحظية؛ إما تُضبط بـ set أو تُقرأ من دالة عند كل عرض."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, doc: str, labelnames: tuple = (), provider=None):
+        super().__init__(name, doc, labelnames)
+        self.provider = provider       # دالة ترجع {tuple(labels): value}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self) -> list[str]:
+        if self.provider:
+            try:
+                values = self.provider()
+            except Exception as e:
+                print("Metrics provider error:", e)
+                values = {}
+            with self._lock:
+                self._values = dict(values)
+        return super().render()
+
+
+class HistogramMetric(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labelnames: tuple = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._values.items()]
+        for key, (counts, total, n) in items:
+            for bound, c in zip(self.buckets, counts):
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_labels_text(self.labelnames, key, le)} {c}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels_text(self.labelnames, key, le)} {n}")
+            lines.append(f"{self.name}_sum{_labels_text(self.labelnames, key)} {round(total, 6)}")
+            lines.append(f"{self.name}_count{_labels_text(self.labelnames, key)} {n}")
+        return lines
+
+
+metrics_registry: list[Metric] = []
+
+api_latency = HistogramMetric(
+    "f90_api_request_seconds", "API-FOOTBALL request latency incl. parsing", ("endpoint",)
+)
+api_errors = CounterMetric("f90_api_errors_total", "API-FOOTBALL failed requests", ("endpoint",))
+tg_latency = HistogramMetric("f90_telegram_send_seconds", "Telegram Bot API call latency", ("method",))
+tg_failures = CounterMetric(
+    "f90_telegram_failures_total", "Telegram Bot API failed calls", ("method", "code")
+)
+tg_commands = CounterMetric("f90_telegram_commands_total", "Webhook commands answered", ("command",))
+live_tick_duration = HistogramMetric(
+    "f90_live_tick_seconds", "process_live_fixtures tick duration",
+    buckets=(0.25, 0.5, 1, 2, 5, 10, 20, 40, 60, 120),
+)
+
+# آخر قيم من ترويسات x-ratelimit-* لـ API-FOOTBALL (None = غير معروف بعد)
+api_quota = {"day_limit": None, "day_remaining": None,
+             "minute_limit": None, "minute_remaining": None, "updated_at": None}
+
+
+def update_api_quota(headers):
+    """قراءة حدود الحصة من ترويسات رد API-FOOTBALL."""
+    fields = {
+        "day_limit": "x-ratelimit-requests-limit",
+        "day_remaining": "x-ratelimit-requests-remaining",
+        "minute_limit": "X-RateLimit-Limit",
+        "minute_remaining": "X-RateLimit-Remaining",
+    }
+    found = False
+    for key, header in fields.items():
+        value = headers.get(header)
+        if value is None:
+            continue
+        try:
+            api_quota[key] = int(value)
+            found = True
+        except ValueError:
+            continue
+    if found:
+        api_quota["updated_at"] = time.time()
+
+
+def render_metrics() -> str:
+    lines: list[str] = []
+    for metric in metrics_registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# ============================
+#   جلسات HTTP مشتركة
+# ============================
+
+http_stats = {"requests": 0, "retries": 0, "errors": 0}
+_http_stats_lock = threading.Lock()
+
+
+def make_session(pool_size: int, retry: Retry) -> requests.Session:
+    """جلسة requests باتصالات دائمة وسياسة إعادة محاولة خاصة بها."""
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# API-FOOTBALL: طلبات GET فقط، إعادتها آمنة على 429/5xx وأخطاء القراءة
+api_session = make_session(HTTP_API_POOL_SIZE, Retry(
+    total=HTTP_MAX_RETRIES,
+    backoff_factor=HTTP_BACKOFF_FACTOR,
+    status_forcelist=HTTP_RETRY_STATUSES,
+    allowed_methods=frozenset({"GET"}),
+    respect_retry_after_header=True,
+    raise_on_status=False,
+))
+# Telegram: POST غير idempotent — نعيد فقط عند فشل الاتصال (الطلب لم يصل)،
+# أما 429 فيتولاها TelegramOutbox عبر retry_after
+tg_session = make_session(HTTP_TG_POOL_SIZE, Retry(
+    total=HTTP_MAX_RETRIES,
+    connect=HTTP_MAX_RETRIES,
+    read=0,
+    status=0,
+    other=0,
+    backoff_factor=HTTP_BACKOFF_FACTOR,
+    allowed_methods=None,
+    raise_on_status=False,
+))
+
+
+def http_request(session: requests.Session, method: str, url: str, **kwargs) -> requests.Response:
+    """طلب عبر جلسة مشتركة مع تحديث العدادات."""
+    with _http_stats_lock:
+        http_stats["requests"] += 1
+    try:
+        r = session.request(method, url, **kwargs)
+    except Exception:
+        with _http_stats_lock:
+            http_stats["errors"] += 1
+        raise
+    retries = getattr(r.raw, "retries", None)
+    if retries is not None and retries.history:
+        with _http_stats_lock:
+            http_stats["retries"] += len(retries.history)
+    return r
+
+
+def http_stats_snapshot() -> dict:
+    """العدادات + عدد الاتصالات الجديدة مقابل المعاد استخدامها."""
+    opened = 0
+    pool_requests = 0
+    for session in (api_session, tg_session):
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                opened += pool.num_connections
+                pool_requests += pool.num_requests
+
+    with _http_stats_lock:
+        snap = dict(http_stats)
+    snap["connections_opened"] = opened
+    snap["connections_reused"] = max(0, pool_requests - opened)
+    return snap
+
 # ============================
 #   أدوات عامة
 # ============================
 
-def tg_send_message(text: str):
-    """إرسال نص لتلجرام."""
+def tg_api(method: str, data: dict, timeout: float = 15) -> dict:
+    """استدعاء Bot API وإرجاع رد تلجرام كما هو (ok/result أو error_code/parameters)."""
     if not BOT_TOKEN:
         print("❌ BOT_TOKEN مفقود.")
-        return
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
+        return {"ok": False, "description": "BOT_TOKEN missing"}
+    url = f"{TELEGRAM_API_BASE}/bot{BOT_TOKEN}/{method}"
+    start = time.perf_counter()
     try:
-        r = requests.post(
-            url,
-            data={"chat_id": CHAT_ID, "text": text, "parse_mode": "HTML"},
-            timeout=15,
-        )
-        if r.status_code != 200:
-            print("Telegram sendMessage error:", r.text)
+        r = http_request(tg_session, "POST", url, data=data, timeout=timeout)
     except Exception as e:
-        print("Telegram sendMessage exception:", e)
+        tg_failures.inc(method=method, code="exception")
+        return {"ok": False, "description": f"exception: {e}"}
+    finally:
+        tg_latency.observe(time.perf_counter() - start, method=method)
+    try:
+        resp = r.json()
+    except ValueError:
+        resp = {"ok": False, "error_code": r.status_code, "description": r.text}
+    if not resp.get("ok"):
+        tg_failures.inc(method=method, code=resp.get("error_code", r.status_code))
+    return resp
+
+
+def tg_send_message(text: str) -> dict | None:
+    """إرسال نص لتلجرام (متزامن). يرجع الرسالة المرسلة أو None."""
+    resp = tg_api(
+        "sendMessage",
+        {"chat_id": CHAT_ID, "text": text, "parse_mode": "HTML"},
+        timeout=15,
+    )
+    if not resp.get("ok"):
+        print("Telegram sendMessage error:", resp.get("description"))
+        return None
+    return resp.get("result")
 
 
-def tg_send_photo(photo_url: str, caption: str):
-    """إرسال صورة + كابشن. لو فشل يرسل نص فقط."""
-    if not BOT_TOKEN:
-        print("❌ BOT_TOKEN مفقود.")
+class MediaCache:
+    """
+    file_id الذي يرجعه تلجرام لكل صورة أُرسلت (المفتاح رابطها أو مثلاً team:<id>)،
+    فيُعاد استخدامه بدل أن يحمّل تلجرام نفس الشعار كل مرة.
+    LRU بحد أقصى للعناصر، محفوظ في جدول media_cache حتى بعد إعادة التشغيل.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.stats = {"hits": 0, "misses": 0, "stored": 0, "evictions": 0, "invalid": 0}
+
+    def _load(self):
+        if self._loaded or not state_store:
+            return
+        self._loaded = True
+        for key, file_id in state_store.load_media():
+            self._data[key] = file_id
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            self._load()
+            file_id = self._data.get(key)
+            if file_id is None:
+                self.stats["misses"] += 1
+                return None
+            self._data.move_to_end(key)
+            self.stats["hits"] += 1
+        if state_store:
+            state_store.set_media(key, file_id)
+        return file_id
+
+    def put(self, key: str, file_id: str):
+        evicted = []
+        with self._lock:
+            self._load()
+            self._data[key] = file_id
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                evicted.append(self._data.popitem(last=False)[0])
+            self.stats["stored"] += 1
+            self.stats["evictions"] += len(evicted)
+        if state_store:
+            state_store.set_media(key, file_id, evicted)
+
+    def forget(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+            self.stats["invalid"] += 1
+        if state_store:
+            state_store.set_media(key, None)
+
+    def stats_snapshot(self) -> dict:
+        with self._lock:
+            snap = dict(self.stats)
+            snap["entries"] = len(self._data)
+        return snap
+
+
+media_cache = MediaCache(MEDIA_CACHE_MAX_ENTRIES)
+
+
+def tg_send_photo(photo_url: str, caption: str, media_key: str | None = None) -> dict | None:
+    """
+    إرسال صورة + كابشن. لو سبق إرسالها يُستخدم file_id المحفوظ بدل الرابط.
+    لو فشل يرسل نص فقط.
+    """
+    key = media_key or photo_url
+    file_id = media_cache.get(key)
+    data = {"chat_id": CHAT_ID, "caption": caption, "parse_mode": "HTML"}
+    resp = tg_api("sendPhoto", {**data, "photo": file_id or photo_url}, timeout=20)
+    if not resp.get("ok") and file_id:
+        # file_id لم يعد صالحاً: نعيد بالرابط ونحفظ الجديد
+        media_cache.forget(key)
+        file_id = None
+        resp = tg_api("sendPhoto", {**data, "photo": photo_url}, timeout=20)
+    if not resp.get("ok"):
+        print("Telegram sendPhoto error:", resp.get("description"))
+        return tg_send_message(caption)
+    result = resp.get("result") or {}
+    sizes = result.get("photo") or []
+    if sizes and not file_id:
+        media_cache.put(key, sizes[-1]["file_id"])   # الأكبر حجماً
+    return result
+
+
+# ============================
+#   طابور الإرسال لتلجرام
+# ============================
+
+class TelegramOutbox:
+    """
+    طابور إرسال غير متزامن بعامل واحد:
+    - يحترم حد تلجرام للقناة ويلتزم بـ retry_after عند 429.
+    - الأولوية للأهداف ونهاية المباراة قبل التبديلات.
+    - رسائل نفس المباراة المنتظرة معاً تُدمج في رسالة واحدة.
+    """
+
+    def __init__(self, per_minute: int, max_size: int, chat_id: str = CHAT_ID):
+        self.chat_id = chat_id
+        self.min_interval = 60.0 / per_minute
+        self.max_size = max_size
+        self._heap: list = []          # (priority, seq, item)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._worker: threading.Thread | None = None
+        self._next_send_at = 0.0
+        self.stats = {"enqueued": 0, "sent": 0, "merged": 0, "dropped": 0,
+                      "rate_limited": 0, "failed": 0}
+
+    def enqueue(self, text: str, priority: int = PRIORITY_NORMAL, fixture_id: int | None = None):
+        item = {"text": text, "fixture_id": fixture_id}
+        with self._cond:
+            entry = (priority, next(self._seq), item)
+            if len(self._heap) >= self.max_size:
+                # الطابور ممتلئ: نسقط الأقل أهمية والأحدث
+                worst = max(self._heap)
+                if entry > worst:
+                    self.stats["dropped"] += 1
+                    return
+                self._heap.remove(worst)
+                heapq.heapify(self._heap)
+                self.stats["dropped"] += 1
+            heapq.heappush(self._heap, entry)
+            self.stats["enqueued"] += 1
+            self._cond.notify()
+        self._ensure_worker()
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._cond:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, daemon=True)
+                    self._worker.start()
+
+    def _take(self) -> tuple:
+        with self._cond:
+            while not self._heap:
+                self._cond.wait()
+            priority, seq, item = heapq.heappop(self._heap)
+            fixture_id = item["fixture_id"]
+            if fixture_id is None:
+                return priority, seq, item
+
+            same = sorted(
+                (e for e in self._heap if e[2]["fixture_id"] == fixture_id),
+                key=lambda e: e[1],
+            )
+            parts = sorted([(seq, item["text"])] + [(e[1], e[2]["text"]) for e in same])
+            merged, used = [], []
+            length = 0
+            for part_seq, text in parts:
+                extra = len(text) + (2 if merged else 0)
+                if merged and length + extra > TG_MESSAGE_LIMIT:
+                    break
+                merged.append(text)
+                used.append(part_seq)
+                length += extra
+            if seq not in used:
+                # الرسالة الأعلى أولوية أطول من أن تُدمج مع ما قبلها
+                return priority, seq, item
+
+            used_set = set(used)
+            self._heap = [e for e in self._heap if e[1] not in used_set]
+            heapq.heapify(self._heap)
+            self.stats["merged"] += len(used) - 1
+            return priority, min(used), {"text": "\n\n".join(merged), "fixture_id": fixture_id}
+
+    def _requeue(self, priority: int, seq: int, item: dict):
+        with self._cond:
+            heapq.heappush(self._heap, (priority, seq, item))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            priority, seq, item = self._take()
+            delay = self._next_send_at - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+            resp = tg_api(
+                "sendMessage",
+                {"chat_id": self.chat_id, "text": item["text"], "parse_mode": "HTML"},
+                timeout=15,
+            )
+            now = time.time()
+            if resp.get("ok"):
+                self.stats["sent"] += 1
+            elif resp.get("error_code") == 429:
+                retry_after = (resp.get("parameters") or {}).get("retry_after", 5)
+                self.stats["rate_limited"] += 1
+                self._next_send_at = now + float(retry_after)
+                self._requeue(priority, seq, item)
+                continue
+            else:
+                self.stats["failed"] += 1
+                print("Telegram sendMessage error:", resp.get("description"))
+            self._next_send_at = max(self._next_send_at, now + self.min_interval)
+
+    def stats_snapshot(self) -> dict:
+        with self._cond:
+            snap = dict(self.stats)
+            snap["queued"] = len(self._heap)
+        return snap
+
+
+tg_outbox = TelegramOutbox(TG_MAX_MESSAGES_PER_MINUTE, TG_QUEUE_MAX_SIZE)
+# طابور لكل قناة (حد تلجرام للرسائل يخص كل محادثة على حدة)
+tg_outboxes: dict[str, TelegramOutbox] = {CHAT_ID: tg_outbox}
+_tg_outboxes_lock = threading.Lock()
+
+
+def outbox_for(chat_id: str | None) -> TelegramOutbox:
+    if chat_id is None or chat_id == CHAT_ID:
+        return tg_outbox
+    with _tg_outboxes_lock:
+        if chat_id not in tg_outboxes:
+            tg_outboxes[chat_id] = TelegramOutbox(
+                TG_MAX_MESSAGES_PER_MINUTE, TG_QUEUE_MAX_SIZE, chat_id
+            )
+        return tg_outboxes[chat_id]
+
+
+# داخل عملية shard: الرسائل تُجمع هنا وتُحفظ في جدول outbox بدل الإرسال المباشر
+outbox_spool: list[tuple] | None = None
+
+
+def tg_enqueue(text: str, priority: int = PRIORITY_NORMAL, fixture_id: int | None = None,
+               chat_id: str | None = None):
+    """إرسال عبر الطابور بدون انتظار تلجرام (القناة الرئيسية إن لم تُحدد)."""
+    if outbox_spool is not None:
+        outbox_spool.append((text, priority, fixture_id, chat_id))
         return
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendPhoto"
-    try:
-        r = requests.post(
-            url,
-            data={
-                "chat_id": CHAT_ID,
-                "caption": caption,
-                "parse_mode": "HTML",
-                "photo": photo_url,
-            },
-            timeout=20,
-        )
-        if r.status_code != 200:
-            print("Telegram sendPhoto error:", r.text)
-            tg_send_message(caption)
-    except Exception as e:
-        print("Telegram sendPhoto exception:", e)
-        tg_send_message(caption)
+    outbox_for(chat_id).enqueue(text, priority=priority, fixture_id=fixture_id)
 
 
-def api_football_get(path: str, params: dict | None = None) -> dict:
-    """استدعاء API-FOOTBALL."""
+api_usage = {"day": None, "calls": 0}
+_api_usage_lock = threading.Lock()
+
+
+def count_api_call() -> int:
+    """عدّ طلبات API-FOOTBALL لليوم الحالي (UTC)."""
+    today = datetime.utcnow().date()
+    with _api_usage_lock:
+        if api_usage["day"] != today:
+            api_usage["day"] = today
+            api_usage["calls"] = 0
+        api_usage["calls"] += 1
+        return api_usage["calls"]
+
+
+def api_calls_today() -> int:
+    with _api_usage_lock:
+        if api_usage["day"] != datetime.utcnow().date():
+            return 0
+        return api_usage["calls"]
+
+
+class QuotaDeferred(Exception):
+    """الطلب أُجّل لأن الحصة المتبقية محجوزة لأولويات أعلى."""
+
+
+class QuotaGovernor:
+    """
+    حوكمة حصة API-FOOTBALL:
+    - دلو توكنات للدقيقة (السعة من X-RateLimit-Limit ويُقصّ بـ X-RateLimit-Remaining).
+    - الحصة اليومية من x-ratelimit-requests-* (أو API_DAILY_REQUEST_BUDGET قبل وصولها).
+    كل أولوية تحتاج حداً أدنى متبقياً؛ فعند شح الحصة تُؤجَّل الجداول والهدافين أولاً
+    وتبقى طلبات اللايف.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = float(QUOTA_PER_MINUTE_DEFAULT)
+        self._refilled_at = time.time()
+        self._synced_at = None
+        self.share = 1.0                 # نصيب هذه العملية من حصة الدقيقة (وضع shards)
+        self.stats = {"granted": [0, 0, 0, 0], "deferred": [0, 0, 0, 0]}
+
+    def capacity(self) -> float:
+        return float(api_quota["minute_limit"] or QUOTA_PER_MINUTE_DEFAULT) * self.share
+
+    def daily_state(self) -> tuple[int, int]:
+        """(الحد اليومي، المستهلك اليوم)."""
+        limit = api_quota["day_limit"]
+        remaining = api_quota["day_remaining"]
+        updated = api_quota["updated_at"]
+        if limit and remaining is not None and updated and (
+            datetime.fromtimestamp(updated, timezone.utc).date() == datetime.utcnow().date()
+        ):
+            return limit, limit - remaining
+        return API_DAILY_REQUEST_BUDGET, api_calls_today()
+
+    def _refill(self, now: float):
+        cap = self.capacity()
+        # مزامنة مع ما يقوله المزود عن الدقيقة الحالية
+        updated = api_quota["updated_at"]
+        if updated and updated != self._synced_at and api_quota["minute_remaining"] is not None:
+            remaining = float(api_quota["minute_remaining"]) * self.share
+            # أول ترويسة تحدد الرصيد؛ بعدها نأخذ الأقل (طلبات أخرى قد تكون في الطريق)
+            self._tokens = remaining if self._synced_at is None else min(self._tokens, remaining)
+            self._synced_at = updated
+        self._tokens = min(cap, self._tokens + (now - self._refilled_at) * cap / 60.0)
+        self._refilled_at = now
+
+    def _try_take(self, priority: int) -> bool:
+        now = time.time()
+        with self._lock:
+            self._refill(now)
+            if self._tokens - 1 < self.capacity() * QUOTA_MINUTE_RESERVE.get(priority, 0.5):
+                return False
+            self._tokens -= 1
+            return True
+
+    def acquire(self, priority: int) -> bool:
+        limit, used = self.daily_state()
+        if limit and (limit - used) / limit < QUOTA_DAILY_RESERVE.get(priority, 0.25):
+            self.stats["deferred"][priority] += 1
+            return False
+        deadline = time.time() + (QUOTA_LIVE_WAIT_SECONDS if priority == API_PRIORITY_LIVE else 0)
+        while True:
+            if self._try_take(priority):
+                self.stats["granted"][priority] += 1
+                return True
+            if time.time() >= deadline:
+                self.stats["deferred"][priority] += 1
+                return False
+            time.sleep(0.2)
+
+    def snapshot(self) -> dict:
+        limit, used = self.daily_state()
+        with self._lock:
+            tokens = round(self._tokens, 2)
+        return {
+            "minute_tokens": tokens,
+            "minute_capacity": self.capacity(),
+            "day_limit": limit,
+            "day_used": used,
+            "granted": list(self.stats["granted"]),
+            "deferred": list(self.stats["deferred"]),
+        }
+
+
+quota_governor = QuotaGovernor()
+
+
+def api_football_request(path: str, params: dict | None = None, stream: bool = False,
+                         priority: int = API_PRIORITY_BACKGROUND):
+    if not quota_governor.acquire(priority):
+        raise QuotaDeferred(f"{path} (priority {priority})")
+    count_api_call()
     headers = {"x-apisports-key": API_FOOTBALL_KEY} if API_FOOTBALL_KEY else {}
-    base = "https://v3.football.api-sports.io"
+    r = http_request(
+        api_session, "GET", API_FOOTBALL_BASE + path, headers=headers, params=params, timeout=20,
+        stream=stream,
+    )
+    update_api_quota(r.headers)
+    return r
+
+
+def api_football_get(path: str, params: dict | None = None,
+                     priority: int = API_PRIORITY_BACKGROUND) -> dict:
+    """استدعاء API-FOOTBALL."""
+    start = time.perf_counter()
     try:
-        r = requests.get(base + path, headers=headers, params=params, timeout=20)
+        r = api_football_request(path, params, priority=priority)
         data = r.json()
         if data.get("errors"):
+            api_errors.inc(endpoint=path)
             print("API-FOOTBALL errors:", data["errors"])
         return data
+    except QuotaDeferred:
+        return {"response": [], "deferred": True}
     except Exception as e:
+        api_errors.inc(endpoint=path)
         print("API-FOOTBALL exception:", e)
-        return {"response": []}
+        return {"response": [], "exception": str(e)}
+    finally:
+        api_latency.observe(time.perf_counter() - start, endpoint=path)
+
+
+class FixtureRecord:
+    """ملخص مباراة بالحقول التي نستخدمها فقط بدل شجرة JSON الكاملة."""
+
+    __slots__ = (
+        "id", "date", "kickoff", "status_short", "status_long", "elapsed",
+        "league_id", "league_name",
+        "home_id", "home_name", "home_logo",
+        "away_id", "away_name", "away_logo",
+        "goals_home", "goals_away",
+    )
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_api(cls, fx: dict) -> "FixtureRecord":
+        f = fx.get("fixture") or {}
+        status = f.get("status") or {}
+        league = fx.get("league") or {}
+        home = (fx.get("teams") or {}).get("home") or {}
+        away = (fx.get("teams") or {}).get("away") or {}
+        goals = fx.get("goals") or {}
+        date_iso = f.get("date") or ""
+        try:
+            kickoff = datetime.fromisoformat(date_iso.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            kickoff = None
+        return cls(
+            id=f.get("id"),
+            date=date_iso,
+            kickoff=kickoff,
+            status_short=status.get("short"),
+            status_long=status.get("long"),
+            elapsed=status.get("elapsed"),
+            league_id=league.get("id"),
+            league_name=league.get("name", ""),
+            home_id=home.get("id"),
+            home_name=home.get("name", ""),
+            home_logo=home.get("logo"),
+            away_id=away.get("id"),
+            away_name=away.get("name", ""),
+            away_logo=away.get("logo"),
+            goals_home=goals.get("home"),
+            goals_away=goals.get("away"),
+        )
+
+
+FIXTURES_HEAD_BYTES = 16384   # بداية الرد: فيها errors (تأتي قبل response ومعها رد فارغ)
+
+
+def parse_fixtures_stream(raw) -> tuple[list[FixtureRecord], object]:
+    """
+    قراءة متدفقة لرد /fixtures: ijson.items (محلل C) يبني عناصر response واحداً
+    واحداً ويُختصر كل عنصر فوراً، فلا تبقى الشجرة الكاملة في الذاكرة.
+    errors تُقرأ من أول الرد المحفوظ فقط حين لا توجد سجلات. يرجع (السجلات، errors).
+    """
+    head = bytearray()
+
+    def read(size=-1):
+        chunk = raw.read(size)
+        if len(head) < FIXTURES_HEAD_BYTES:
+            head.extend(chunk[:FIXTURES_HEAD_BYTES - len(head)])
+        return chunk
+
+    records = [FixtureRecord.from_api(item)
+               for item in ijson.items(SimpleNamespace(read=read), "response.item")]
+    if records:
+        return records, None
+    try:
+        return records, json.loads(bytes(head)).get("errors")
+    except ValueError:
+        return records, None
+
+
+def api_football_get_fixtures(params: dict | None = None,
+                              priority: int = API_PRIORITY_BACKGROUND) -> dict:
+    """/fixtures مع تحليل متدفق؛ response تحتوي FixtureRecord بدل القواميس."""
+    start = time.perf_counter()
+    try:
+        r = api_football_request("/fixtures", params, stream=ijson is not None, priority=priority)
+        try:
+            if ijson is not None:
+                r.raw.decode_content = True
+                records, errors = parse_fixtures_stream(r.raw)
+            else:
+                data = r.json()
+                records = [FixtureRecord.from_api(fx) for fx in data.get("response", [])]
+                errors = data.get("errors")
+        finally:
+            r.close()
+        if errors:
+            api_errors.inc(endpoint="/fixtures")
+            print("API-FOOTBALL errors:", errors)
+        return {"response": records, "errors": errors or []}
+    except QuotaDeferred:
+        return {"response": [], "deferred": True}
+    except Exception as e:
+        api_errors.inc(endpoint="/fixtures")
+        print("API-FOOTBALL exception:", e)
+        return {"response": [], "exception": str(e)}
+    finally:
+        api_latency.observe(time.perf_counter() - start, endpoint="/fixtures")
+
+
+def fetch_many(func, keys: list, max_workers: int = LIVE_FETCH_CONCURRENCY,
+               deadline: float = LIVE_TICK_DEADLINE_SECONDS) -> list:
+    """
+    تشغيل func على كل مفتاح بالتوازي (بحد أقصى max_workers).
+    النتائج ترجع بنفس ترتيب keys، وما لم ينتهِ قبل المهلة أو فشل يرجع None.
+    """
+    if not keys:
+        return []
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(keys))))
+    futures = [pool.submit(func, k) for k in keys]
+    done, not_done = wait(futures, timeout=deadline)
+    # لا ننتظر الطلبات المتأخرة؛ تُلغى أو تنتهي في الخلفية
+    pool.shutdown(wait=False, cancel_futures=True)
+    if not_done:
+        print(f"⚠️ {len(not_done)} طلب/طلبات تجاوزت مهلة {deadline} ثانية.")
+
+    results = []
+    for fut in futures:
+        if fut not in done:
+            results.append(None)
+            continue
+        try:
+            results.append(fut.result())
+        except Exception as e:
+            print("Parallel fetch error:", e)
+            results.append(None)
+    return results
+
+
+class ResponseCache:
+    """
+    كاش LRU محدود الحجم مع TTL لكل مدخل.
+    الطلبات المتزامنة لنفس المفتاح تنتظر جلباً واحداً بدل تكراره.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: OrderedDict = OrderedDict()   # key -> (expires_at, value)
+        self._inflight: dict = {}                 # key -> threading.Event
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+
+    def peek(self, key, allow_stale: bool = False):
+        """قيمة من الكاش بدون جلب (أو None). allow_stale يقبل المنتهية صلاحيتها."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry and (allow_stale or entry[0] > time.time()):
+                return entry[1]
+        return None
+
+    def scan(self, path: str) -> list:
+        """كل القيم المخزنة لـ endpoint (حتى المنتهية) — للقراءة فقط بدون أي طلب."""
+        with self._lock:
+            return [entry[1] for key, entry in self._data.items() if key[0] == path]
+
+    def put(self, key, value, ttl: float):
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def get_or_fetch(self, key, ttl: float, fetch, cacheable=lambda v: True):
+        waited = False
+        while True:
+            with self._lock:
+                entry = self._data.get(key)
+                if entry and entry[0] > time.time():
+                    self._data.move_to_end(key)
+                    if not waited:
+                        self.stats["hits"] += 1
+                    return entry[1]
+                event = self._inflight.get(key)
+                owner = event is None
+                if owner:
+                    event = self._inflight[key] = threading.Event()
+                    if not waited:
+                        self.stats["misses"] += 1
+                elif not waited:
+                    self.stats["coalesced"] += 1
+
+            if not owner:
+                # جلب آخر جارٍ لنفس المفتاح؛ ننتظره ثم نعيد الفحص
+                event.wait(timeout=60)
+                waited = True
+                continue
+
+            try:
+                value = fetch()
+                if cacheable(value):
+                    self.put(key, value, ttl)
+                return value
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                event.set()
+
+    def stats_snapshot(self) -> dict:
+        with self._lock:
+            snap = dict(self.stats)
+            snap["entries"] = len(self._data)
+        lookups = snap["hits"] + snap["misses"] + snap["coalesced"]
+        snap["hit_ratio"] = round((snap["hits"] + snap["coalesced"]) / lookups, 3) if lookups else 0.0
+        return snap
+
+
+api_cache = ResponseCache(API_CACHE_MAX_ENTRIES)
+
+
+def api_failed(data: dict) -> bool:
+    """هل الرد خطأ (من المزود أو استثناء اتصال)؟"""
+    return (bool(data.get("errors")) or "exception" in data or "deferred" in data
+            or "response" not in data)
+
+
+def api_football_get_cached(path: str, params: dict | None = None,
+                            priority: int = API_PRIORITY_BACKGROUND,
+                            ttl: float | None = None) -> dict:
+    """
+    api_football_get عبر الكاش حسب TTL الـ endpoint أو ttl (بدون TTL = طلب مباشر).
+    لو أُجّل الطلب بسبب الحصة نرجع آخر نسخة منتهية الصلاحية من الكاش إن وُجدت.
+    """
+    if path == "/fixtures":
+        getter = lambda p: api_football_get_fixtures(p, priority=priority)
+    else:
+        getter = lambda p: api_football_get(path, p, priority=priority)
+    ttl = ttl or API_CACHE_TTLS.get(path)
+    if not ttl:
+        return getter(params)
+    key = (path, tuple(sorted((params or {}).items())))
+    data = api_cache.get_or_fetch(
+        key,
+        ttl,
+        lambda: getter(params),
+        cacheable=lambda data: not api_failed(data),
+    )
+    if data.get("deferred"):
+        stale = api_cache.peek(key, allow_stale=True)
+        if stale is not None:
+            return stale
+    return data
 
 
 def utc_to_local_str(iso_str: str) -> str:
@@ -126,34 +1142,221 @@ def utc_to_local_str(iso_str: str) -> str:
         return iso_str
 
 
-def is_favorite_match(fixture: dict) -> bool:
-    """هل المباراة تخص فريق VIP؟"""
-    home = fixture["teams"]["home"]["name"]
-    away = fixture["teams"]["away"]["name"]
-    for name in FAVORITE_TEAMS:
-        if name.lower() in home.lower() or name.lower() in away.lower():
-            return True
-    return False
+class TeamIndex:
+    """
+    مطابقة الفرق المفضلة: بالرقم أولاً؛ الاسم يُطابق كاملاً (لا جزءاً منه) مع كل
+    الأسماء البديلة بتعبير منتظم واحد، وفقط حين لا يوجد رقم أو للمفضلة بلا رقم معروف.
+    النتيجة لكل فريق تُحفظ (حسب الرقم أو الاسم) فلا يتكرر البحث.
+    """
+
+    def __init__(self, names: list[str], ids: dict[int, str], aliases: dict[str, list[str]]):
+        self.by_id = dict(ids)
+        self._alias_to_name: dict[str, str] = {}
+        for name in names:
+            for alias in [name] + aliases.get(name, []):
+                self._alias_to_name[alias.lower()] = name
+        self._regex = self._compile(self._alias_to_name)
+        # فريق له رقم غير مفضل لا يُطابق بالاسم إلا مع المفضلة التي لا نعرف رقمها
+        by_id_names = set(self.by_id.values())
+        self._regex_no_id = self._compile(
+            [a for a, name in self._alias_to_name.items() if name not in by_id_names]
+        )
+        self._memo: dict = {}
+
+    @staticmethod
+    def _compile(aliases):
+        pattern = "|".join(re.escape(a) for a in sorted(aliases, key=len, reverse=True))
+        return re.compile(pattern, re.IGNORECASE) if pattern else None
+
+    def match_team(self, team_id: int | None, name: str) -> str | None:
+        """اسم الفريق المفضل المطابق (أو None)."""
+        if team_id in self.by_id:
+            return self.by_id[team_id]
+        key = team_id if team_id is not None else name
+        if key in self._memo:
+            return self._memo[key]
+        regex = self._regex if team_id is None else self._regex_no_id
+        found = self._memo[key] = self._fullmatch(regex, name)
+        return found
+
+    def search(self, text: str) -> str | None:
+        """مطابقة نص حر (مثل استعلام مستخدم) بدون حفظ في الذاكرة."""
+        return self._fullmatch(self._regex, text)
+
+    def _fullmatch(self, regex, text: str) -> str | None:
+        if not regex or not text:
+            return None
+        m = regex.fullmatch(text.strip())
+        return self._alias_to_name.get(m.group(0).lower()) if m else None
+
+    def match_fixture(self, fx: FixtureRecord) -> tuple[str | None, str | None]:
+        """(مطابقة المضيف، مطابقة الضيف)."""
+        return (
+            self.match_team(fx.home_id, fx.home_name),
+            self.match_team(fx.away_id, fx.away_name),
+        )
+
+
+favorite_index = TeamIndex(FAVORITE_TEAMS, FAVORITE_TEAM_IDS, TEAM_ALIASES)
+
+
+def is_favorite_match(fx: FixtureRecord) -> str | None:
+    """هل المباراة تخص فريق VIP؟ يرجع اسم الفريق المطابق."""
+    home, away = favorite_index.match_fixture(fx)
+    return home or away
+
+
+# ============================
+#   القنوات واشتراكاتها
+# ============================
+
+ALERT_KINDS = ("kickoff", "goal", "status", "stats", "card", "subst", "pre_match")
+
+
+class Channel:
+    """قناة نشر: كل فلتر غير محدد = الكل. الدوري أو الفريق يكفي للمطابقة."""
+
+    def __init__(self, chat_id: str, leagues=None, teams=None, events=None):
+        self.chat_id = chat_id
+        self.leagues = set(leagues) if leagues else None
+        self.vip = teams == "favorites"      # فرق FAVORITE_TEAMS (بالرقم أو الاسم)
+        self.teams = set(teams) if teams and not self.vip else None
+        self.events = set(events) if events else None
+
+    @property
+    def any_fixture(self) -> bool:
+        return self.leagues is None and self.teams is None and not self.vip
+
+
+def load_channels(raw: str | None) -> list[Channel]:
+    if not raw:
+        return [Channel(CHAT_ID)]
+    try:
+        channels = [
+            Channel(c["chat_id"], c.get("leagues"), c.get("teams"), c.get("events"))
+            for c in json.loads(raw)
+        ]
+    except Exception as e:
+        print("❌ CHANNELS غير صالحة، الاكتفاء بـ CHAT_ID:", e)
+        return [Channel(CHAT_ID)]
+    for ch in channels:
+        unknown = sorted((ch.events or set()) - set(ALERT_KINDS))
+        if unknown:
+            print(f"❌ أنواع تنبيه غير معروفة للقناة {ch.chat_id} في CHANNELS: {', '.join(unknown)}"
+                  f" (المتاح: {', '.join(ALERT_KINDS)})")
+    return channels
+
+
+class ChannelRouter:
+    """
+    فهرس مسبق للاشتراكات: دوري → قنوات، فريق → قنوات، وقنوات بلا فلتر.
+    قنوات كل مباراة تُحسب مرة واحدة وتُحفظ حتى تخرج المباراة من الحالة،
+    وبعدها يبقى فقط فحص نوع التنبيه لكل قناة.
+    """
+
+    def __init__(self, channels: list[Channel]):
+        self.channels = channels
+        self._any: list[int] = []
+        self._vip: list[int] = []
+        self._by_league: dict[int, list[int]] = {}
+        self._by_team: dict[int, list[int]] = {}
+        for i, ch in enumerate(channels):
+            if ch.any_fixture:
+                self._any.append(i)
+            if ch.vip:
+                self._vip.append(i)
+            for league_id in ch.leagues or ():
+                self._by_league.setdefault(league_id, []).append(i)
+            for team_id in ch.teams or ():
+                self._by_team.setdefault(team_id, []).append(i)
+        self._by_fixture: dict[int, tuple[Channel, ...]] = {}
+
+    def fixture_channels(self, fx: FixtureRecord) -> tuple[Channel, ...]:
+        found = self._by_fixture.get(fx.id)
+        if found is None:
+            idx = set(self._any)
+            idx.update(self._by_league.get(fx.league_id, ()))
+            idx.update(self._by_team.get(fx.home_id, ()))
+            idx.update(self._by_team.get(fx.away_id, ()))
+            if self._vip and is_favorite_match(fx):
+                idx.update(self._vip)
+            found = tuple(self.channels[i] for i in sorted(idx))
+            self._by_fixture[fx.id] = found
+        return found
+
+    def match(self, fx: FixtureRecord, kind: str) -> list[Channel]:
+        return [ch for ch in self.fixture_channels(fx) if ch.events is None or kind in ch.events]
+
+    def forget(self, fixture_ids):
+        for fid in fixture_ids:
+            self._by_fixture.pop(fid, None)
+
+
+channel_router = ChannelRouter(load_channels(CHANNELS_JSON))
+
+
+def publish_alert(fx: FixtureRecord, kind: str, text: str, priority: int = PRIORITY_NORMAL):
+    """تنبيه مباراة لكل قناة تطابق فلاترها (المباراة والأحداث جُلبت مرة واحدة)."""
+    for ch in channel_router.match(fx, kind):
+        tg_enqueue(text, priority, fx.id, ch.chat_id)
 
 # ============================
 #   جلب المباريات القادمة (Next)
 # ============================
 
-def fetch_next_fixtures(limit: int = 50) -> list[dict]:
+def fetch_next_fixtures(limit: int = 50) -> list[FixtureRecord]:
     """
     جلب أول (limit) مباراة قادمة من كل العالم.
     هذا يضمن دائماً وجود جدول حتى لو بعد شهر أو سنة.
+    كل الحدود تُخدم من طلب next واحد مشترك في الكاش.
     """
-    data = api_football_get("/fixtures", params={"next": limit, "timezone": "UTC"})
-    return data.get("response", [])
+    window = max(limit, NEXT_FIXTURES_WINDOW)
+    data = api_football_get_cached("/fixtures", params={"next": window, "timezone": "UTC"})
+    return data.get("response", [])[:limit]
 
 
-def group_schedule_text(fixtures: list[dict]) -> str:
+def cached_fixtures() -> list[FixtureRecord]:
+    """كل المباريات الموجودة في الكاش (الجدول العام، الفرق، الدوريات) بدون تكرار."""
+    seen: dict[int, FixtureRecord] = {}
+    for data in api_cache.scan("/fixtures"):
+        for fx in data.get("response", []):
+            seen.setdefault(fx.id, fx)
+    return list(seen.values())
+
+
+def pack_messages(blocks: list[str], limit: int = TG_MESSAGE_LIMIT) -> list[str]:
+    """
+    تجميع كتل نصية في أقل عدد من الرسائل (كل رسالة ≤ limit) دون قسمة أي كتلة.
+    الكتلة الأطول من الحد وحدها تُقسم على الأسطر كحل أخير.
+    """
+    messages: list[str] = []
+    current: list[str] = []
+    length = 0
+    for block in blocks:
+        pieces = [block]
+        if len(block) > limit:
+            pieces = pack_messages(block.split("\n"), limit) if "\n" in block else \
+                [block[i:i + limit] for i in range(0, len(block), limit)]
+        for piece in pieces:
+            extra = len(piece) + (1 if current else 0)
+            if current and length + extra > limit:
+                messages.append("\n".join(current))
+                current, length = [], 0
+                extra = len(piece)
+            current.append(piece)
+            length += extra
+    if current:
+        messages.append("\n".join(current))
+    return messages
+
+
+def group_schedule_blocks(fixtures: list[FixtureRecord]) -> list[str]:
     """
-    تنسيق جدول عام:
+    تنسيق جدول عام ككتل لا تُقسم:
     - مباريات اليوم
     - مباريات الغد
     - مباريات أخرى قادمة
+    عنوان كل قسم ملتصق بأول مباراة فيه حتى لا يبقى وحيداً آخر رسالة.
     """
 
     today = datetime.utcnow().date()
@@ -164,11 +1367,9 @@ def group_schedule_text(fixtures: list[dict]) -> str:
     later_matches = []
 
     for fx in fixtures:
-        date_iso = fx["fixture"]["date"]
-        try:
-            dt = datetime.fromisoformat(date_iso.replace("Z", "+00:00"))
-            d = dt.date()
-        except Exception:
+        if fx.kickoff is not None:
+            d = datetime.fromtimestamp(fx.kickoff, timezone.utc).date()
+        else:
             d = today
 
         if d == today:
@@ -178,40 +1379,117 @@ def group_schedule_text(fixtures: list[dict]) -> str:
         else:
             later_matches.append(fx)
 
-    parts: list[str] = []
-    parts.append("🏟️ <b>جدول المباريات القادمة (F90 Sports)</b>\n")
+    blocks: list[str] = ["🏟️ <b>جدول المباريات القادمة (F90 Sports)</b>\n"]
+    predictions = predictions_by_fixture(fixtures)
 
-    def block(title: str, items: list[dict]) -> str:
+    def section(title: str, items: list[FixtureRecord]):
         if not items:
-            return f"📆 <b>{title}</b>\nلا توجد مباريات.\n"
-        lines = [f"📆 <b>{title}</b>"]
-        for fx in items[:40]:
-            f = fx["fixture"]
-            l = fx["league"]
-            t = fx["teams"]
-
-            home = t["home"]["name"]
-            away = t["away"]["name"]
-            league_name = l["name"]
-            time_str = utc_to_local_str(f["date"])
-
-            lines.append(
-                f"🏟 {home} vs {away}\n"
-                f"   🏆 {league_name}\n"
-                f"   ⏰ {time_str}"
+            blocks.append(f"📆 <b>{title}</b>\nلا توجد مباريات.\n")
+            return
+        for i, fx in enumerate(items):
+            entry = (
+                f"🏟 {fx.home_name} vs {fx.away_name}\n"
+                f"   🏆 {fx.league_name}\n"
+                f"   ⏰ {utc_to_local_str(fx.date)}"
             )
-        return "\n".join(lines)
+            if fx.id in predictions:
+                entry += "\n   " + prediction_line(predictions[fx.id])
+            if i == 0:
+                entry = f"📆 <b>{title}</b>\n" + entry
+            if i == len(items) - 1:
+                entry += "\n"
+            blocks.append(entry)
+
+    section("مباريات اليوم", today_matches)
+    section("مباريات الغد", tomorrow_matches)
+    section("مباريات قادمة", later_matches)
+    blocks.append("📺 البث والقنوات الناقلة يتم إضافتها من الإدارة عند التوفر.\n"
+                  "📣 لمتابعة أخبار كرة القدم لحظة بلحظة: @F90Sports")
+    return blocks
+
+
+def group_schedule_text(fixtures: list[FixtureRecord]) -> list[str]:
+    """الجدول العام مقسوماً على رسائل ≤ TG_MESSAGE_LIMIT."""
+    return pack_messages(group_schedule_blocks(fixtures))
+
 
-    parts.append(block("مباريات اليوم", today_matches))
-    parts.append("")
-    parts.append(block("مباريات الغد", tomorrow_matches))
-    parts.append("")
-    parts.append(block("مباريات قادمة", later_matches[:30]))
-    parts.append("")
-    parts.append("📺 البث والقنوات الناقلة يتم إضافتها من الإدارة عند التوفر.\n"
-                 "📣 لمتابعة أخبار كرة القدم لحظة بلحظة: @F90Sports")
+def content_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
 
-    return "\n".join(parts)
+
+posted_schedules: dict[str, dict] = {}   # kind -> {"chunks", "entries", "message_ids"}
+
+
+def load_posted(kind: str) -> dict | None:
+    if kind not in posted_schedules and state_store:
+        saved = state_store.get_json(f"posted:{kind}")
+        if saved:
+            posted_schedules[kind] = saved
+    return posted_schedules.get(kind)
+
+
+def save_posted(kind: str, record: dict):
+    posted_schedules[kind] = record
+    if state_store:
+        state_store.set_json(f"posted:{kind}", record)
+
+
+def tg_edit_message(message_id: int, text: str) -> bool:
+    resp = tg_api("editMessageText", {
+        "chat_id": CHAT_ID,
+        "message_id": message_id,
+        "text": text,
+        "parse_mode": "HTML",
+    })
+    if resp.get("ok") or "not modified" in (resp.get("description") or ""):
+        return True
+    print("Telegram editMessageText error:", resp.get("description"))
+    return False
+
+
+def publish_tracked(kind: str, chunks: list[str], entries: list[str]) -> str:
+    """
+    نشر جدول (رسالة أو أكثر بالترتيب) مع تتبع بصمة المحتوى:
+    - لا تغيير → لا إرسال.
+    - تغيّر جزء من المباريات فقط ونفس عدد الرسائل → تعديل الرسائل التي تغيّرت فقط.
+    - غير ذلك (أو فشل التعديل) → رسائل جديدة بالترتيب عبر نفس الجلسة.
+    يرجع "skipped" أو "edited" أو "posted" أو "failed".
+    """
+    chunk_hashes = [content_hash(c) for c in chunks]
+    entry_hashes = [content_hash(e) for e in entries]
+    prev = load_posted(kind)
+    if prev and prev.get("chunks") == chunk_hashes:
+        return "skipped"
+
+    message_ids = (prev or {}).get("message_ids") or []
+    if prev and len(message_ids) == len(chunks):
+        old, new = set(prev.get("entries", [])), set(entry_hashes)
+        ratio = len(old ^ new) / max(len(old | new), 1)
+        if ratio <= SCHEDULE_EDIT_MAX_CHANGED_RATIO:
+            old_chunks = prev.get("chunks", [])
+            if all(
+                old_chunks[i:i + 1] == [h] or tg_edit_message(message_ids[i], chunks[i])
+                for i, h in enumerate(chunk_hashes)
+            ):
+                save_posted(kind, {"chunks": chunk_hashes, "entries": entry_hashes,
+                                   "message_ids": message_ids})
+                return "edited"
+
+    sent_ids = []
+    for chunk in chunks:
+        msg = tg_send_message(chunk)
+        if not msg:
+            # لا نكمل حتى لا تصل الأجزاء بترتيب مكسور
+            return "failed"
+        sent_ids.append(msg.get("message_id"))
+    save_posted(kind, {"chunks": chunk_hashes, "entries": entry_hashes,
+                       "message_ids": sent_ids})
+    return "posted"
+
+
+def fixture_entry_key(fx: FixtureRecord) -> str:
+    """ما يميّز مدخل مباراة في الجدول (يتغير لو تغيّر موعدها أو طرفاها)."""
+    return f"{fx.id}|{fx.date}|{fx.home_name}|{fx.away_name}|{fx.league_name}"
 
 
 def send_global_schedule():
@@ -220,102 +1498,439 @@ def send_global_schedule():
     if not fixtures:
         tg_send_message("📆 لا توجد مباريات قادمة متاحة حالياً (أو خطأ من المزود).")
         return
-    msg = group_schedule_text(fixtures)
-    tg_send_message(msg)
+    kickoff_timers.load(fixtures)
+    chunks = group_schedule_text(fixtures)
+    publish_tracked("global_schedule", chunks, [fixture_entry_key(fx) for fx in fixtures])
 
 
 # ============================
 #   جدول خاص للفرق الكبيرة
 # ============================
 
-def send_favorites_schedule():
-    """نشر جدول خاص لأقرب مباراة لكل فريق من FAVORITE_TEAMS."""
-    fixtures = fetch_next_fixtures(limit=200)
-    if not fixtures:
-        return
+team_ids: dict[str, int] = {}       # اسم فريق VIP -> رقمه في API-FOOTBALL
 
-    team_next = {name: None for name in FAVORITE_TEAMS}
 
-    for fx in fixtures:
-        f = fx["fixture"]
-        t = fx["teams"]
-        home = t["home"]["name"]
-        away = t["away"]["name"]
+def resolve_favorite_team_ids() -> dict[str, int]:
+    """
+    أرقام FAVORITE_TEAMS: من FAVORITE_TEAM_IDS، ثم المحفوظ في التخزين،
+    وما بقي يُبحث عنه مرة واحدة عبر /teams?search ويُحفظ.
+    """
+    if all(name in team_ids for name in FAVORITE_TEAMS):
+        return team_ids
+
+    team_ids.update({name: tid for tid, name in FAVORITE_TEAM_IDS.items()})
+    if state_store:
+        team_ids.update(state_store.get_json("team_ids", {}))
+
+    missing = [name for name in FAVORITE_TEAMS if name not in team_ids]
+    found = {}
+    for name, data in zip(missing, fetch_many(
+        lambda n: api_football_get("/teams", params={"search": n}), missing
+    )):
+        resp = (data or {}).get("response", [])
+        if resp:
+            found[name] = resp[0]["team"]["id"]
+    if found:
+        team_ids.update(found)
+        if state_store:
+            state_store.set_json("team_ids", {n: team_ids[n] for n in FAVORITE_TEAMS if n in team_ids})
+    return team_ids
+
+
+def fetch_team_next_fixtures(team_id: int, limit: int = TEAM_NEXT_FIXTURES) -> list[FixtureRecord] | None:
+    """أقرب مباريات فريق واحد (None لو فشل الطلب)."""
+    data = api_football_get_cached(
+        "/fixtures", params={"team": team_id, "next": limit, "timezone": "UTC"}
+    )
+    return None if api_failed(data) else data.get("response", [])
+
 
-        for name in FAVORITE_TEAMS:
-            if name.lower() in home.lower() or name.lower() in away.lower():
+def fetch_league_next_fixtures(league_id: int, limit: int = LEAGUE_NEXT_FIXTURES) -> list[FixtureRecord]:
+    data = api_football_get_cached(
+        "/fixtures", params={"league": league_id, "next": limit, "timezone": "UTC"}
+    )
+    return data.get("response", [])
+
+
+def favorites_next_fixtures() -> dict[str, FixtureRecord | None] | None:
+    """
+    أقرب مباراة لكل فريق VIP.
+    بالفلترة من السيرفر: طلب صغير لكل فريق بالتوازي، والمسح العالمي فقط لمن لم يُحل رقمه.
+    يرجع None لو تعذّر الجلب كلياً.
+    """
+    team_next: dict[str, FixtureRecord | None] = {name: None for name in FAVORITE_TEAMS}
+    pending = list(FAVORITE_TEAMS)
+
+    if SERVER_SIDE_FILTERS:
+        ids = resolve_favorite_team_ids()
+        names = [name for name in FAVORITE_TEAMS if name in ids]
+        results = fetch_many(lambda n: fetch_team_next_fixtures(ids[n]), names)
+        for name, fxs in zip(names, results):
+            if fxs:
+                team_next[name] = fxs[0]
+        # فشل الطلب (None) أو لا رقم للفريق → نرجع للمسح العالمي
+        done = {name for name, fxs in zip(names, results) if fxs is not None}
+        pending = [name for name in FAVORITE_TEAMS if name not in done]
+
+    if pending:
+        fixtures = fetch_next_fixtures(limit=200)
+        if not fixtures and len(pending) == len(FAVORITE_TEAMS):
+            return None
+        for fx in fixtures:
+            for name in favorite_index.match_fixture(fx):
                 # لو لسه ما حطينا مباراة لهذا الفريق
-                if team_next[name] is None:
+                if name in pending and team_next[name] is None:
                     team_next[name] = fx
 
-    lines = ["🔥 <b>أقرب مباريات الفرق الكبيرة (VIP)</b>\n"]
+    return team_next
+
+
+def send_favorites_schedule():
+    """نشر جدول خاص لأقرب مباراة لكل فريق من FAVORITE_TEAMS."""
+    team_next = favorites_next_fixtures()
+    if team_next is None:
+        return
+    kickoff_timers.load([fx for fx in team_next.values() if fx])
+
+    blocks = ["🔥 <b>أقرب مباريات الفرق الكبيرة (VIP)</b>\n"]
     any_match = False
+    predictions = predictions_by_fixture([fx for fx in team_next.values() if fx])
 
     for name, fx in team_next.items():
         if not fx:
             continue
         any_match = True
-        f = fx["fixture"]
-        l = fx["league"]
-        t = fx["teams"]
-
-        home = t["home"]["name"]
-        away = t["away"]["name"]
-        league_name = l["name"]
-        time_str = utc_to_local_str(f["date"])
-
-        lines.append(f"⭐ <b>{name}</b>")
-        lines.append(f"🏟 {home} vs {away}")
-        lines.append(f"🏆 {league_name}")
-        lines.append(f"⏰ {time_str}")
-        lines.append("")
+        pred = predictions.get(fx.id)
+        blocks.append(
+            f"⭐ <b>{name}</b>\n"
+            f"🏟 {fx.home_name} vs {fx.away_name}\n"
+            f"🏆 {fx.league_name}\n"
+            f"⏰ {utc_to_local_str(fx.date)}\n"
+            + (prediction_line(pred) + "\n" if pred is not None else "")
+        )
 
     if not any_match:
-        lines.append("لا توجد مباريات قادمة حالياً لهذه الفرق.")
+        blocks.append("لا توجد مباريات قادمة حالياً لهذه الفرق.")
     else:
-        lines.append("📺 روابط البث تُضاف من الإدارة عند التوفر.")
+        blocks.append("📺 روابط البث تُضاف من الإدارة عند التوفر.")
 
-    tg_send_message("\n".join(lines))
+    entries = [f"{name}|{fixture_entry_key(fx)}" for name, fx in team_next.items() if fx]
+    publish_tracked("favorites_schedule", pack_messages(blocks), entries)
 
 
 # ============================
 #   هدافي الدوريات
 # ============================
 
-def send_top_scorers():
-    """نشر هدافي أهم الدوريات."""
-    msg_parts = ["⚽️ <b>قائمة الهدافين (إحصائيات تقريبية)</b>\n"]
+league_seasons: dict[str, dict] = {}   # league_id -> {"season", "end"}
+_league_seasons_lock = threading.Lock()
 
-    for league_id in IMPORTANT_LEAGUES[:5]:  # نكتفي بـ 5 دوريات
-        data = api_football_get(
-            "/players/topscorers",
-            params={"league": league_id, "season": datetime.utcnow().year},
-        )
-        resp = data.get("response", [])
+
+def current_season(league_id: int) -> int:
+    """
+    الموسم الحالي للدوري من /leagues?current=true (موسم 2025 قد يمتد حتى 2026).
+    يُحل مرة واحدة ويُحفظ في kv حتى تاريخ نهاية الموسم.
+    """
+    key = str(league_id)
+    with _league_seasons_lock:
+        if not league_seasons and state_store:
+            league_seasons.update(state_store.get_json("league_seasons", {}))
+        known = league_seasons.get(key)
+    today = datetime.utcnow().date().isoformat()
+    if known and (known.get("end") or "9999") >= today:
+        return known["season"]
+
+    data = api_football_get("/leagues", params={"id": league_id, "current": "true"})
+    for item in data.get("response", []):
+        for season in item.get("seasons", []):
+            if season.get("current"):
+                with _league_seasons_lock:
+                    league_seasons[key] = {"season": season["year"], "end": season.get("end")}
+                    snapshot = dict(league_seasons)
+                if state_store:
+                    state_store.set_json("league_seasons", snapshot)
+                return season["year"]
+    # فشل الطلب: تقدير بدون حفظ، ويُعاد الحل في المرة القادمة
+    return known["season"] if known else datetime.utcnow().year
+
+
+def topscorers_ttl(league_id: int, now: float | None = None) -> float:
+    """صلاحية قصيرة في يوم مباريات الدوري، وإلا حتى ما بعد أقرب مباراة له."""
+    now = now or time.time()
+    if any(fx.league_id == league_id for fx in live_fixtures):
+        return TOPSCORERS_MATCHDAY_TTL
+    kickoffs = [fx.kickoff for fx in cached_fixtures()
+                if fx.league_id == league_id and fx.kickoff is not None]
+    if any(now - TOPSCORERS_AFTER_KICKOFF <= k <= now for k in kickoffs):
+        return TOPSCORERS_MATCHDAY_TTL
+    upcoming = [k for k in kickoffs if k > now]
+    if not upcoming:
+        return TOPSCORERS_MAX_TTL / 2
+    ttl = min(upcoming) + TOPSCORERS_AFTER_KICKOFF - now
+    return min(max(ttl, TOPSCORERS_MIN_TTL), TOPSCORERS_MAX_TTL)
+
+
+def fetch_top_scorers(league_id: int) -> list[dict] | None:
+    """هدافو الدوري للموسم الحالي من الكاش (مفتاحه league + season)."""
+    data = api_football_get_cached(
+        "/players/topscorers",
+        params={"league": league_id, "season": current_season(league_id)},
+        ttl=topscorers_ttl(league_id),
+    )
+    return None if api_failed(data) else data.get("response", [])
+
+
+def top_scorers_signature(resp: list[dict]) -> list[list]:
+    return [
+        [p["player"]["id"], p["statistics"][0]["goals"]["total"]]
+        for p in resp[:TOPSCORERS_TOP_N]
+    ]
+
+
+def send_top_scorers():
+    """نشر هدافي أهم الدوريات: جلب متوازٍ، ونشر الدوريات التي تغيّر أول 5 فيها فقط."""
+    results = fetch_many(fetch_top_scorers, IMPORTANT_LEAGUES,
+                         deadline=BACKGROUND_JOB_DEADLINE_SECONDS)
+    previous = state_store.get_json("topscorers_top5", {}) if state_store else {}
+    current = dict(previous)
+
+    blocks = ["⚽️ <b>قائمة الهدافين (إحصائيات تقريبية)</b>\n"]
+    for league_id, resp in zip(IMPORTANT_LEAGUES, results):
         if not resp:
             continue
+        signature = top_scorers_signature(resp)
+        if previous.get(str(league_id)) == signature:
+            continue
+        current[str(league_id)] = signature
 
         league_name = resp[0]["statistics"][0]["league"]["name"]
-        msg_parts.append(f"🏆 <b>{league_name}</b>:")
-
-        for i, p in enumerate(resp[:5], start=1):
+        lines = [f"🏆 <b>{league_name}</b>:"]
+        for i, p in enumerate(resp[:TOPSCORERS_TOP_N], start=1):
             player_name = p["player"]["name"]
             team_name = p["statistics"][0]["team"]["name"]
             goals = p["statistics"][0]["goals"]["total"]
-            msg_parts.append(f"{i}. {player_name} ({team_name}) – {goals} هدف")
-
-        msg_parts.append("")
+            lines.append(f"{i}. {player_name} ({team_name}) – {goals} هدف")
+        blocks.append("\n".join(lines) + "\n")
 
-    if len(msg_parts) > 1:
-        tg_send_message("\n".join(msg_parts))
+    if len(blocks) == 1:
+        print("⚽️ لا تغيير في الهدافين.")
+        return
+    for chunk in pack_messages(blocks):
+        if not tg_send_message(chunk):
+            return   # لا نحفظ اللقطة فتُعاد المحاولة في المرة القادمة
+    if state_store:
+        state_store.set_json("topscorers_top5", current)
 
 
 # ============================
-#   مباراة الأسبوع + توقع بسيط
+#   مباراة الأسبوع + التوقعات
 # ============================
 
+def outcome_probabilities(lam_home, lam_away):
+    """(n, 3): فوز المضيف، تعادل، فوز الضيف من مصفوفة أهداف Poisson لكل مباراة."""
+    k = np.arange(PREDICT_MAX_GOALS + 1)
+    log_fact = np.cumsum(np.log(np.maximum(k, 1)))
+    p_home = np.exp(k * np.log(lam_home)[:, None] - lam_home[:, None] - log_fact)
+    p_away = np.exp(k * np.log(lam_away)[:, None] - lam_away[:, None] - log_fact)
+    joint = p_home[:, :, None] * p_away[:, None, :]          # (n, أهداف المضيف، أهداف الضيف)
+    home_win = (joint * np.tril(np.ones((k.size, k.size)), -1)).sum(axis=(1, 2))
+    draw = np.einsum("nii->n", joint)
+    away_win = (joint * np.triu(np.ones((k.size, k.size)), 1)).sum(axis=(1, 2))
+    probs = np.column_stack([home_win, draw, away_win])
+    return probs / probs.sum(axis=1, keepdims=True)
+
+
+class PredictionEngine:
+    """
+    نموذج Poisson مستقل لأهداف كل فريق:
+        λ_المضيف = exp(mu + home + att[المضيف] − def[الضيف])
+        λ_الضيف  = exp(mu + att[الضيف] − def[المضيف])
+    التقييمات من PREDICT_RATINGS_PATH (يُعاد تحميله لو تغيّر الملف)،
+    وكل المباريات تُحسب في تمريرة NumPy واحدة.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.mu = PREDICT_DEFAULT_MU
+        self.home = PREDICT_DEFAULT_HOME
+        self.teams: dict[int, tuple[float, float]] = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.mu, self.home = data["mu"], data["home"]
+            self.teams = {int(t): (att, dfn) for t, (att, dfn) in data["teams"].items()}
+        except Exception as e:
+            print("Ratings load error:", e)
+        self._mtime = mtime
+
+    def _strength(self, team_id: int | None, name: str) -> tuple[float, float]:
+        if team_id in self.teams:
+            return self.teams[team_id]
+        if favorite_index.match_team(team_id, name) in PREDICT_BIG_CLUBS:
+            return PREDICT_BIG_CLUB_PRIOR, PREDICT_BIG_CLUB_PRIOR
+        return 0.0, 0.0
+
+    def predict(self, fixtures: list[FixtureRecord]):
+        """
+        مصفوفة (n, 5): فوز المضيف، تعادل، فوز الضيف، أهداف متوقعة للمضيف وللضيف.
+        صف المباراة NaN إن لم يكن لأي من الفريقين تقييم ملائم.
+        None بدون numpy أو بدون ملف تقييمات.
+        """
+        if np is None or not fixtures:
+            return None
+        with self._lock:
+            self._refresh()
+            if not self.teams:
+                return None
+            rated = np.array([fx.home_id in self.teams or fx.away_id in self.teams
+                              for fx in fixtures])
+            strengths = np.array([
+                self._strength(fx.home_id, fx.home_name) + self._strength(fx.away_id, fx.away_name)
+                for fx in fixtures
+            ])
+            mu, home = self.mu, self.home
+        att_h, def_h, att_a, def_a = strengths.T
+        lam_home = np.exp(mu + home + att_h - def_a)
+        lam_away = np.exp(mu + att_a - def_h)
+        preds = np.column_stack([outcome_probabilities(lam_home, lam_away), lam_home, lam_away])
+        preds[~rated] = np.nan
+        return preds
+
+
+prediction_engine = PredictionEngine(PREDICT_RATINGS_PATH)
+
+
+def predictions_by_fixture(fixtures: list[FixtureRecord]) -> dict:
+    """fixture_id -> صف التوقع للمباريات ذات التقييم فقط (فارغ بدون numpy أو تقييمات)."""
+    preds = prediction_engine.predict(fixtures)
+    if preds is None:
+        return {}
+    return {fx.id: row for fx, row in zip(fixtures, preds) if not np.isnan(row[0])}
+
+
+def prediction_line(row) -> str:
+    return f"🔮 {row[0]:.0%} • تعادل {row[1]:.0%} • {row[2]:.0%}"
+
+
+def fit_ratings(results: list[tuple], now: float | None = None) -> dict:
+    """
+    ملاءمة mu و home و (att, def) لكل فريق بأقصى احتمال (Poisson) مع وزن يتناقص
+    بعمر النتيجة. results: (home_id, away_id, goals_home, goals_away, kickoff).
+    كل تكرار تحديث مغلق لكل معامل (bincount) فتكفي ~100 تكرار لآلاف المباريات.
+    """
+    now = now or time.time()
+    arr = np.asarray(results, dtype=float)
+    teams, idx = np.unique(arr[:, :2].astype(np.int64), return_inverse=True)
+    h, a = idx.reshape(-1, 2).T
+    gh, ga = arr[:, 2], arr[:, 3]
+    age_days = np.maximum(now - arr[:, 4], 0) / 86400
+    w = 0.5 ** (age_days / PREDICT_FIT_HALF_LIFE_DAYS)
+    n, k = teams.size, PREDICT_FIT_PRIOR_GOALS
+
+    att, dfn = np.zeros(n), np.zeros(n)
+    mu = np.log(np.sum(w * (gh + ga)) / (2 * np.sum(w)) + 1e-9)
+    home = np.log((np.sum(w * gh) + 1) / (np.sum(w * ga) + 1))
+
+    def rates():
+        return np.exp(mu + home + att[h] - dfn[a]), np.exp(mu + att[a] - dfn[h])
+
+    for _ in range(PREDICT_FIT_ITERATIONS):
+        lam_h, lam_a = rates()
+        scored = np.bincount(h, w * gh, n) + np.bincount(a, w * ga, n)
+        expected = np.bincount(h, w * lam_h, n) + np.bincount(a, w * lam_a, n)
+        att += np.log((scored + k) / (expected + k))
+
+        lam_h, lam_a = rates()
+        conceded = np.bincount(a, w * gh, n) + np.bincount(h, w * ga, n)
+        expected = np.bincount(a, w * lam_h, n) + np.bincount(h, w * lam_a, n)
+        dfn -= np.log((conceded + k) / (expected + k))
+
+        att -= att.mean()
+        dfn -= dfn.mean()
+        lam_h, lam_a = rates()
+        mu += np.log(np.sum(w * (gh + ga)) / np.sum(w * (lam_h + lam_a)))
+        lam_h, _ = rates()
+        home += np.log(np.sum(w * gh) / np.sum(w * lam_h))
+
+    return {
+        "fitted_at": now,
+        "matches": int(arr.shape[0]),
+        "mu": round(float(mu), 5),
+        "home": round(float(home), 5),
+        "teams": {
+            str(t): [round(float(x), 5), round(float(y), 5)] for t, x, y in zip(teams, att, dfn)
+        },
+    }
+
+
+def backfill_results(seasons: int = 2) -> int:
+    """جلب نتائج المواسم الأخيرة للدوريات المهمة إلى جدول results (للملاءمة فقط)."""
+    keys = [(league_id, current_season(league_id) - back)
+            for league_id in IMPORTANT_LEAGUES for back in range(seasons)]
+    fetched = fetch_many(
+        lambda key: api_football_get_fixtures(
+            {"league": key[0], "season": key[1], "status": "FT-AET-PEN", "timezone": "UTC"}
+        ).get("response", []),
+        keys, deadline=BACKGROUND_JOB_DEADLINE_SECONDS,
+    )
+    count = 0
+    for fixtures in fetched:
+        for fx in fixtures or []:
+            if fx.goals_home is not None and fx.goals_away is not None:
+                state_store.add_result(fx)
+                count += 1
+    state_store.commit()
+    return count
+
+
+def refit_ratings(backfill: bool = False) -> dict | None:
+    """الخطوة الدون اتصال: (اختياري) جلب النتائج، ثم ملاءمة التقييمات وحفظها في ملف."""
+    if np is None:
+        print("❌ الملاءمة تحتاج numpy (pip install numpy).")
+        return None
+    if state_store is None:
+        init_state()
+    if backfill:
+        print(f"📥 نتائج مجلوبة: {backfill_results()}")
+    results = state_store.load_results()
+    if not results:
+        print("لا توجد نتائج محفوظة للملاءمة (جرّب --backfill).")
+        return None
+    start = time.perf_counter()
+    ratings = fit_ratings(results)
+    tmp = PREDICT_RATINGS_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(ratings, f)
+    os.replace(tmp, PREDICT_RATINGS_PATH)
+    print(f"🔮 تقييمات {len(ratings['teams'])} فريق من {ratings['matches']} مباراة "
+          f"في {time.perf_counter() - start:.2f} ثانية → {PREDICT_RATINGS_PATH}")
+    return ratings
+
+
 def pick_match_of_week():
     """اختيار مباراة قوية من المباريات القادمة كـ 'مباراة الأسبوع'."""
+    if SERVER_SIDE_FILTERS:
+        # أولوية للفرق الكبيرة ثم الدوريات المهمة – كلها بطلبات مفلترة
+        team_next = favorites_next_fixtures() or {}
+        vip_matches = [fx for fx in team_next.values() if fx]
+        if vip_matches:
+            return min(vip_matches, key=lambda fx: fx.kickoff or 0)
+
+        per_league = fetch_many(fetch_league_next_fixtures, IMPORTANT_LEAGUES)
+        league_matches = [fx for fxs in per_league if fxs for fx in fxs]
+        if league_matches:
+            return min(league_matches, key=lambda fx: fx.kickoff or 0)
+
     fixtures = fetch_next_fixtures(limit=80)
     if not fixtures:
         return None
@@ -327,29 +1942,22 @@ def pick_match_of_week():
 
     # أولوية للدوريات الكبيرة
     for fx in fixtures:
-        league_name = fx["league"]["name"].lower()
+        league_name = fx.league_name.lower()
         if any(k in league_name for k in ["champions", "الدوري", "league"]):
             return fx
 
     return fixtures[0]
 
 
-def simple_predict(home_name: str, away_name: str) -> str:
-    """توقع بسيط جداً لأجل الشكل."""
-    big = [
-        "real madrid",
-        "barcelona",
-        "manchester city",
-        "bayern",
-        "liverpool",
-        "al nassr",
-        "al hilal",
-        "al ittihad",
-    ]
+def simple_predict(fx: FixtureRecord) -> str:
+    """توقع بسيط جداً حين لا يتوفر توقع النموذج (بدون numpy أو بدون تقييم للفريقين)."""
+    home_name = fx.home_name
+    away_name = fx.away_name
+    home_big, away_big = favorite_index.match_fixture(fx)
     score = 0
-    if any(b in home_name.lower() for b in big):
+    if home_big in PREDICT_BIG_CLUBS:
         score += 1
-    if any(b in away_name.lower() for b in big):
+    if away_big in PREDICT_BIG_CLUBS:
         score -= 1
 
     if score > 0:
@@ -360,33 +1968,37 @@ def simple_predict(home_name: str, away_name: str) -> str:
         return "🧠 التوقع: مباراة متقاربة جداً، الفرص متساوية."
 
 
+def predict_text(fx: FixtureRecord) -> str:
+    preds = prediction_engine.predict([fx])
+    if preds is None or np.isnan(preds[0][0]):
+        return simple_predict(fx)
+    home_win, draw, away_win, xg_home, xg_away = preds[0]
+    return (
+        "🧠 <b>التوقع (نموذج Poisson):</b>\n"
+        f"فوز {fx.home_name}: {home_win:.0%} • تعادل: {draw:.0%} • فوز {fx.away_name}: {away_win:.0%}\n"
+        f"⚽️ الأهداف المتوقعة: {xg_home:.1f} - {xg_away:.1f}"
+    )
+
+
 def send_match_of_week():
     fx = pick_match_of_week()
     if not fx:
         print("لا توجد مباراة أسبوع مناسبة.")
         return
 
-    f = fx["fixture"]
-    l = fx["league"]
-    t = fx["teams"]
-
-    home = t["home"]["name"]
-    away = t["away"]["name"]
-    league_name = l["name"]
-    time_str = utc_to_local_str(f["date"])
-
     txt = (
         "💥 <b>مباراة الأسبوع – F90 Sports</b>\n\n"
-        f"🏟 {home} vs {away}\n"
-        f"🏆 {league_name}\n"
-        f"⏰ {time_str}\n\n"
-        f"{simple_predict(home, away)}\n\n"
+        f"🏟 {fx.home_name} vs {fx.away_name}\n"
+        f"🏆 {fx.league_name}\n"
+        f"⏰ {utc_to_local_str(fx.date)}\n\n"
+        f"{predict_text(fx)}\n\n"
         "📺 البث والقنوات الناقلة يتم إضافتها من الإدارة عند التوفر."
     )
 
-    logo = t["home"].get("logo") or t["away"].get("logo")
+    logo = fx.home_logo or fx.away_logo
     if logo:
-        tg_send_photo(logo, txt)
+        team_id = fx.home_id if fx.home_logo else fx.away_id
+        tg_send_photo(logo, txt, media_key=f"team:{team_id}" if team_id else None)
     else:
         tg_send_message(txt)
 
@@ -396,90 +2008,454 @@ def send_match_of_week():
 # ============================
 
 live_state: dict[int, dict] = {}   # fixture_id -> {score_home, score_away, status}
-seen_events: set[str] = set()
+live_fixtures: list[FixtureRecord] = []  # آخر رد live=all كامل (لأمر /live)
+# fixture_id -> {هوية الحدث: بصمة محتواه} (أرقام 64 بت؛ يُحرَّر كاملاً عند نهاية المباراة)
+event_index: dict[int, dict[int, int]] = {}
+# مباريات من قاعدة قديمة (seen_events): أول جلب لها يُسجَّل بدون تنبيهات
+event_baseline: set[int] = set()
 pre_alerts: dict[int, dict] = {}   # fixture_id -> {"10":bool, "5":bool}
+live_seen_at: dict[int, float] = {}  # fixture_id -> آخر مرة ظهرت في اللايف
+# fixture_id -> آخر سجل لايف لمباريات هذه العملية؛ الغائبة عن live=all تُجلب مرة أخيرة
+live_records: dict[int, FixtureRecord] = {}
+events_checked_at: dict[int, float] = {}  # fixture_id -> آخر جلب ناجح للأحداث
+events_hot_until: dict[int, float] = {}   # fixture_id -> متابعة الأحداث كل دورة حتى هذا الوقت
 
 
-def fetch_live_fixtures() -> list[dict]:
-    data = api_football_get("/fixtures", params={"live": "all", "timezone": "UTC"})
-    return data.get("response", [])
+class StateStore:
+    """
+    تخزين live_state و event_index و pre_alerts في SQLite (وضع WAL).
+    الكتابة تدريجية (صف لكل تغيير) والـ commit مرة كل دورة.
+    """
 
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS live_state (
+            fixture_id INTEGER PRIMARY KEY,
+            score_home INTEGER,
+            score_away INTEGER,
+            status TEXT,
+            seen_at REAL NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS event_index (
+            fixture_id INTEGER NOT NULL,
+            ident INTEGER NOT NULL,
+            content INTEGER NOT NULL,
+            PRIMARY KEY (fixture_id, ident)
+        ) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS pre_alerts (
+            fixture_id INTEGER NOT NULL,
+            tag TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (fixture_id, tag)
+        ) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS kv (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS results (
+            fixture_id INTEGER PRIMARY KEY,
+            home_id INTEGER NOT NULL,
+            away_id INTEGER NOT NULL,
+            goals_home INTEGER NOT NULL,
+            goals_away INTEGER NOT NULL,
+            kickoff REAL NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS media_cache (
+            key TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            used_at REAL NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            priority INTEGER NOT NULL,
+            fixture_id INTEGER,
+            chat_id TEXT
+        )""",
+    )
 
-def fetch_fixture_events(fixture_id: int) -> list[dict]:
-    data = api_football_get("/fixtures/events", params={"fixture": fixture_id})
-    return data.get("response", [])
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for stmt in self.SCHEMA:
+            self._conn.execute(stmt)
+        try:
+            # قواعد أُنشئت قبل دعم القنوات المتعددة
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN chat_id TEXT")
+        except sqlite3.OperationalError:
+            pass
+        # جدول المفاتيح النصية القديم: يُقرأ للترحيل ويُنظف مع purge فقط
+        self._legacy_events = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'seen_events'"
+        ).fetchone() is not None
+        self._conn.commit()
+
+    def load(self) -> tuple[dict, dict, dict, dict, set]:
+        with self._lock:
+            states, seen_at = {}, {}
+            for fid, sh, sa, status, ts in self._conn.execute(
+                "SELECT fixture_id, score_home, score_away, status, seen_at FROM live_state"
+            ):
+                states[fid] = {"score_home": sh, "score_away": sa, "status": status}
+                seen_at[fid] = ts
+            events: dict[int, dict[int, int]] = {}
+            for fid, ident, content in self._conn.execute(
+                "SELECT fixture_id, ident, content FROM event_index"
+            ):
+                events.setdefault(fid, {})[ident] = content
+            legacy = set()
+            if self._legacy_events:
+                legacy = {fid for (fid,) in self._conn.execute(
+                    "SELECT DISTINCT fixture_id FROM seen_events"
+                )} - set(events)
+            alerts: dict[int, dict] = {}
+            for fid, tag in self._conn.execute("SELECT fixture_id, tag FROM pre_alerts"):
+                alerts.setdefault(fid, {"10": False, "5": False})[tag] = True
+        return states, events, alerts, seen_at, legacy
+
+    def save_fixture(self, fixture_id: int, state: dict, seen_at: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO live_state VALUES (?, ?, ?, ?, ?)",
+                (fixture_id, state["score_home"], state["score_away"], state["status"], seen_at),
+            )
 
+    def set_event(self, fixture_id: int, ident: int, content: int):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO event_index VALUES (?, ?, ?)", (fixture_id, ident, content)
+            )
 
-def fetch_fixture_stats(fixture_id: int) -> list[dict]:
-    data = api_football_get("/fixtures/statistics", params={"fixture": fixture_id})
-    return data.get("response", [])
+    def remove_events(self, fixture_id: int, idents: list[int]):
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM event_index WHERE fixture_id = ? AND ident = ?",
+                [(fixture_id, ident) for ident in idents],
+            )
 
+    def free_events(self, fixture_id: int):
+        with self._lock:
+            self._conn.execute("DELETE FROM event_index WHERE fixture_id = ?", (fixture_id,))
 
-def ensure_pre_alerts(fixture_id: int):
-    if fixture_id not in pre_alerts:
-        pre_alerts[fixture_id] = {"10": False, "5": False}
+    def set_pre_alert(self, fixture_id: int, tag: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO pre_alerts VALUES (?, ?, ?)",
+                (fixture_id, tag, time.time()),
+            )
 
+    def purge(self, cutoff: float) -> list[int]:
+        """حذف كل ما يخص المباريات التي لم تظهر منذ cutoff. يرجع أرقامها."""
+        with self._lock:
+            old = [fid for (fid,) in self._conn.execute(
+                "SELECT fixture_id FROM live_state WHERE seen_at < ? "
+                "UNION SELECT fixture_id FROM pre_alerts WHERE created_at < ?",
+                (cutoff, cutoff),
+            )]
+            if old:
+                rows = [(fid,) for fid in old]
+                tables = ["live_state", "event_index", "pre_alerts"]
+                if self._legacy_events:
+                    tables.append("seen_events")
+                for table in tables:
+                    self._conn.executemany(f"DELETE FROM {table} WHERE fixture_id = ?", rows)
+            self._conn.commit()
+        return old
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    def rollback(self):
+        with self._lock:
+            self._conn.rollback()
+
+    def spool_messages(self, items: list[tuple]):
+        """رسائل (text, priority, fixture_id, chat_id) تُحفظ مع commit الدورة نفسها."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO outbox (text, priority, fixture_id, chat_id) VALUES (?, ?, ?, ?)",
+                items,
+            )
 
-def check_and_send_pre_match_alerts(fx: dict):
-    """تنبيه قبل 10 دقائق و5 دقائق من البداية."""
-    f = fx["fixture"]
-    fixture_id = f["id"]
-    date_iso = f.get("date")
-    if not date_iso:
-        return
+    def take_outbox(self) -> list[tuple]:
+        """سحب كل الرسائل المحفوظة بالترتيب وحذفها."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, text, priority, fixture_id, chat_id FROM outbox ORDER BY id"
+            ).fetchall()
+            if rows:
+                self._conn.execute("DELETE FROM outbox WHERE id <= ?", (rows[-1][0],))
+                self._conn.commit()
+        return [row[1:] for row in rows]
+
+    def add_result(self, fx: FixtureRecord):
+        """نتيجة نهائية لملاءمة تقييمات التوقع (لا تُحذف مع purge)."""
+        if None in (fx.home_id, fx.away_id, fx.goals_home, fx.goals_away):
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                (fx.id, fx.home_id, fx.away_id, fx.goals_home, fx.goals_away,
+                 fx.kickoff or time.time()),
+            )
 
-    try:
-        dt_utc = datetime.fromisoformat(date_iso.replace("Z", "+00:00")).replace(
-            tzinfo=timezone.utc
-        )
-    except Exception:
+    def load_results(self) -> list[tuple]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT home_id, away_id, goals_home, goals_away, kickoff FROM results"
+            ).fetchall()
+
+    def load_media(self) -> list[tuple[str, str]]:
+        """(key, file_id) من الأقدم استخداماً للأحدث."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT key, file_id FROM media_cache ORDER BY used_at"
+            ).fetchall()
+
+    def set_media(self, key: str, file_id: str | None, evicted=()):
+        """حفظ/تحديث استخدام file_id (None = حذف)، وحذف ما أُخرج من LRU."""
+        with self._lock:
+            if file_id is None:
+                self._conn.execute("DELETE FROM media_cache WHERE key = ?", (key,))
+            else:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO media_cache VALUES (?, ?, ?)",
+                    (key, file_id, time.time()),
+                )
+            self._conn.executemany(
+                "DELETE FROM media_cache WHERE key = ?", [(k,) for k in evicted]
+            )
+            self._conn.commit()
+
+    def get_json(self, key: str, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_json(self, key: str, value):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kv VALUES (?, ?)", (key, json.dumps(value))
+            )
+            self._conn.commit()
+
+
+state_store: StateStore | None = None
+
+
+def init_state(path: str = STATE_DB_PATH):
+    """فتح التخزين الدائم وتحميل الحالة السابقة حتى لا يُعاد إرسال شيء بعد إعادة التشغيل."""
+    global state_store
+    state_store = StateStore(path)
+    load_state()
+    print(f"💾 حالة محفوظة: {len(live_state)} مباراة، "
+          f"{sum(map(len, event_index.values()))} حدث.")
+
+
+def load_state():
+    """استبدال حالة الذاكرة بما هو محفوظ (يُستخدم أيضاً بعد إلغاء معاملة دورة فاشلة)."""
+    states, events, alerts, seen_at, legacy = state_store.load()
+    for table in (live_state, event_index, event_baseline, pre_alerts, live_seen_at,
+                  events_checked_at, events_hot_until):
+        table.clear()
+    live_state.update(states)
+    event_index.update(events)
+    event_baseline.update(legacy)
+    pre_alerts.update(alerts)
+    live_seen_at.update(seen_at)
+
+
+def expire_old_fixtures(now: float | None = None):
+    """إزالة المباريات المنتهية/الغائبة من الذاكرة والتخزين حتى تبقى الذاكرة ثابتة."""
+    cutoff = (now or time.time()) - STATE_RETENTION_SECONDS
+    # عملية shard تنظف ذاكرتها فقط؛ التخزين المشترك ينظفه المنسق حتى يرى هو أيضاً
+    # المباريات المحذوفة (تنبيهات ما قبل المباراة وكاش التوجيه عنده)
+    if state_store and outbox_spool is None:
+        old = set(state_store.purge(cutoff))
+    else:
+        old = set()
+    old.update(fid for fid, ts in live_seen_at.items() if ts < cutoff)
+    if not old:
         return
+    for fid in old:
+        live_state.pop(fid, None)
+        pre_alerts.pop(fid, None)
+        live_seen_at.pop(fid, None)
+        live_records.pop(fid, None)
+        events_checked_at.pop(fid, None)
+        events_hot_until.pop(fid, None)
+        event_index.pop(fid, None)
+        event_baseline.discard(fid)
+    channel_router.forget(old)
+
+
+def fetch_live_fixtures() -> list[FixtureRecord]:
+    data = api_football_get_fixtures(
+        params={"live": "all", "timezone": "UTC"}, priority=API_PRIORITY_LIVE
+    )
+    return data.get("response", [])
 
-    now_utc = datetime.utcnow().replace(tzinfo=timezone.utc)
-    minutes_to_ko = (dt_utc - now_utc).total_seconds() / 60.0
 
-    ensure_pre_alerts(fixture_id)
+def events_priority(fx: FixtureRecord) -> int:
+    return API_PRIORITY_FAV_EVENTS if is_favorite_match(fx) else API_PRIORITY_EVENTS
 
-    home = fx["teams"]["home"]["name"]
-    away = fx["teams"]["away"]["name"]
-    league_name = fx["league"]["name"]
-    time_str = utc_to_local_str(date_iso)
 
-    base_txt = (
-        f"🏟 {home} vs {away}\n"
-        f"🏆 {league_name}\n"
-        f"⏰ {time_str}"
+def fetch_fixture_details(fixture_ids: list[int], priority: int = API_PRIORITY_EVENTS
+                          ) -> dict[int, dict] | None:
+    """
+    أحداث وإحصائيات حتى FIXTURE_IDS_BATCH مباراة بطلب /fixtures?ids واحد.
+    يرجع fixture_id -> {"fixture", "events", "statistics"}، أو None لو فشل الطلب أو أُجّل.
+    """
+    data = api_football_get(
+        "/fixtures", params={"ids": "-".join(map(str, fixture_ids))}, priority=priority
     )
+    if api_failed(data):
+        return None
+    return {
+        item["fixture"]["id"]: {
+            "fixture": FixtureRecord.from_api(item),
+            "events": item.get("events") or [],
+            "statistics": item.get("statistics") or [],
+        }
+        for item in data.get("response", [])
+    }
 
-    # قبل 10 دقائق
-    if 5 < minutes_to_ko <= 10 and not pre_alerts[fixture_id]["10"]:
-        tg_send_message("⏳ <b>بعد 10 دقائق تنطلق مباراة:</b>\n" + base_txt)
-        pre_alerts[fixture_id]["10"] = True
 
-    # قبل 5 دقائق
-    if 0 < minutes_to_ko <= 5 and not pre_alerts[fixture_id]["5"]:
-        tg_send_message("⏳ <b>بعد 5 دقائق تنطلق مباراة:</b>\n" + base_txt)
-        pre_alerts[fixture_id]["5"] = True
+def fetch_details_batched(fixtures: list[FixtureRecord]) -> tuple[dict[int, dict], int]:
+    """
+    تفاصيل كل مباريات الدورة على دفعات من FIXTURE_IDS_BATCH بالتوازي.
+    fixtures مرتبة حسب الأولوية (المفضلة أولاً) فتأخذ كل دفعة أولوية أول مبارياتها.
+    يرجع (fixture_id -> التفاصيل، عدد الطلبات). المباراة الغائبة عن النتيجة تُعاد لاحقاً.
+    """
+    batches = [fixtures[i:i + FIXTURE_IDS_BATCH]
+               for i in range(0, len(fixtures), FIXTURE_IDS_BATCH)]
+    results = fetch_many(
+        lambda batch: fetch_fixture_details([fx.id for fx in batch], events_priority(batch[0])),
+        batches,
+    )
+    details: dict[int, dict] = {}
+    for res in results:
+        if res:
+            details.update(res)
+    return details, len(batches)
 
 
-def format_live_header(fx: dict) -> str:
-    f = fx["fixture"]
-    l = fx["league"]
-    t = fx["teams"]
-    goals = fx["goals"]
+PRE_MATCH_ALERT_MINUTES = (10, 5)     # تنازلياً
 
-    home = t["home"]["name"]
-    away = t["away"]["name"]
-    league_name = l["name"]
-    status = f["status"]["long"]
-    elapsed = f["status"]["elapsed"]
-    score = f"{goals['home']} - {goals['away']}"
-    minute_part = f" {elapsed}'" if elapsed is not None else ""
+
+class KickoffTimers:
+    """
+    مؤقتات تنبيهات ما قبل المباراة: heap بموعد كل تنبيه (الانطلاقة − 10/5 دقائق)
+    من المباريات التي تجلبها مهام الجداول أصلاً. خيط واحد ينام حتى أقرب موعد
+    بالضبط، فلا فحص دوري بين المواعيد ولا علاقة بإيقاع اللايف. موعد مباراة
+    تغيّر وقت انطلاقها يُهمل عند خروجه من الـ heap.
+    """
+
+    def __init__(self):
+        self._heap: list = []            # (fire_at, seq, fixture_id, minutes, kickoff)
+        self._seq = itertools.count()
+        self._fixtures: dict[int, FixtureRecord] = {}
+        self._cond = threading.Condition()
+        self._worker: threading.Thread | None = None
+        self.stats = {"scheduled": 0, "fired": 0, "max_lag": 0.0}
+
+    def load(self, fixtures: list[FixtureRecord]):
+        now = time.time()
+        with self._cond:
+            for fx in fixtures:
+                if fx.kickoff is None or fx.kickoff <= now:
+                    continue
+                prev = self._fixtures.get(fx.id)
+                self._fixtures[fx.id] = fx
+                if prev is not None and prev.kickoff == fx.kickoff:
+                    continue
+                for i, minutes in enumerate(PRE_MATCH_ALERT_MINUTES):
+                    # تنبيه فات موعده يُرسل فوراً ما دام التنبيه التالي لم يحن
+                    later = PRE_MATCH_ALERT_MINUTES[i + 1] if i + 1 < len(PRE_MATCH_ALERT_MINUTES) else 0
+                    if now >= fx.kickoff - later * 60:
+                        continue
+                    fire_at = max(fx.kickoff - minutes * 60, now)
+                    heapq.heappush(self._heap, (fire_at, next(self._seq), fx.id, minutes, fx.kickoff))
+                    self.stats["scheduled"] += 1
+            self._cond.notify()
+        if self._heap:
+            self._ensure_worker()
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._cond:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, daemon=True)
+                    self._worker.start()
+
+    def _next_due(self) -> tuple[float, FixtureRecord, int]:
+        with self._cond:
+            while True:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                delay = self._heap[0][0] - time.time()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                fire_at, _, fixture_id, minutes, kickoff = heapq.heappop(self._heap)
+                fx = self._fixtures.get(fixture_id)
+                if fx is None or fx.kickoff != kickoff:
+                    continue
+                if minutes == PRE_MATCH_ALERT_MINUTES[-1]:
+                    self._fixtures.pop(fixture_id, None)
+                return fire_at, fx, minutes
+
+    def _run(self):
+        while True:
+            fire_at, fx, minutes = self._next_due()
+            self.stats["max_lag"] = max(self.stats["max_lag"], time.time() - fire_at)
+            try:
+                send_pre_match_alert(fx, minutes)
+                self.stats["fired"] += 1
+            except Exception as e:
+                print("Pre-match alert error:", e)
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            snap = dict(self.stats)
+            snap["pending"] = len(self._heap)
+            snap["next_in"] = round(self._heap[0][0] - time.time(), 3) if self._heap else None
+        snap["max_lag"] = round(snap["max_lag"], 3)
+        return snap
+
+
+kickoff_timers = KickoffTimers()
+
+
+def send_pre_match_alert(fx: FixtureRecord, minutes: int):
+    """تنبيه قبل البداية (مرة واحدة لكل مباراة ومدة، حتى بعد إعادة التشغيل)."""
+    tag = str(minutes)
+    if pre_alerts.get(fx.id, {}).get(tag):
+        return
+    pre_alerts.setdefault(fx.id, {"10": False, "5": False})[tag] = True
+    publish_alert(
+        fx, "pre_match",
+        f"⏳ <b>بعد {minutes} دقائق تنطلق مباراة:</b>\n"
+        f"🏟 {fx.home_name} vs {fx.away_name}\n"
+        f"🏆 {fx.league_name}\n"
+        f"⏰ {utc_to_local_str(fx.date)}",
+    )
+    if state_store:
+        state_store.set_pre_alert(fx.id, tag)
+        state_store.commit()
+
+
+def format_live_header(fx: FixtureRecord) -> str:
+    score = f"{fx.goals_home} - {fx.goals_away}"
+    minute_part = f" {fx.elapsed}'" if fx.elapsed is not None else ""
 
     return (
-        f"🏟 {home} vs {away}\n"
-        f"🏆 {league_name}\n"
-        f"⏱ {status}{minute_part}\n"
+        f"🏟 {fx.home_name} vs {fx.away_name}\n"
+        f"🏆 {fx.league_name}\n"
+        f"⏱ {fx.status_long}{minute_part}\n"
         f"🔢 النتيجة: {score}"
     )
 
@@ -507,34 +2483,331 @@ def format_half_stats(stats_resp: list[dict]) -> str:
     return "\n".join(lines)
 
 
-def process_live_fixtures():
-    global live_state
+FAST_PHASES = {"ET", "BT", "P"}
+NORMAL_PHASES = {"1H", "2H", "LIVE"}
+SLOW_PHASES = {"HT", "INT", "SUSP"}
+
+
+def upcoming_kickoffs() -> list[float]:
+    """
+    أوقات انطلاق المباريات القادمة (timestamp) من كل جداول المباريات في الكاش،
+    حتى المنتهية صلاحيتها: موعد الانطلاق لا يتغير عادة بانتهاء TTL.
+    """
+    now = time.time()
+    return [fx.kickoff for fx in cached_fixtures() if fx.kickoff and fx.kickoff > now]
+
+
+def next_live_poll_interval(live: list[FixtureRecord], kickoffs: list[float], daily_budget: int,
+                            calls_today: int, now: float | None = None,
+                            calls_per_tick: int | None = None) -> float:
+    """
+    تحديد موعد الفحص القادم (بالثواني) حسب مرحلة المباريات الجارية:
+    - سريع في الدقائق الأخيرة والأشواط الإضافية وركلات الترجيح.
+    - عادي أثناء الأشواط، بطيء في الاستراحة.
+    - بلا مباريات: نوم حتى قبيل أقرب انطلاقة، أو إيقاع الاستراحة إن لم نعرف أي موعد.
+    ثم لا ننزل تحت ما تسمح به ميزانية الطلبات المتبقية لليوم.
+    """
+    now = now or time.time()
+    phases = [(fx.status_short, fx.elapsed or 0) for fx in live]
+    next_ko = min((k for k in kickoffs if k > now), default=None)
+
+    if any(s in FAST_PHASES or (s == "2H" and m >= LATE_PHASE_MINUTE) for s, m in phases):
+        interval = LIVE_POLL_FAST_SECONDS
+    elif any(s in NORMAL_PHASES for s, _ in phases):
+        interval = LIVE_POLL_SECONDS
+    elif any(s in SLOW_PHASES for s, _ in phases):
+        interval = LIVE_POLL_SLOW_SECONDS
+    elif next_ko is None:
+        # لا نعرف موعد أي مباراة: نفحص بإيقاع الاستراحة حتى لا تفوتنا انطلاقة
+        interval = LIVE_POLL_SLOW_SECONDS
+    else:
+        interval = min(max(next_ko - KICKOFF_LEAD_SECONDS - now, LIVE_POLL_SECONDS),
+                       IDLE_POLL_MAX_SECONDS)
+
+    # لا ننام بعد موعد انطلاقة قريبة
+    if next_ko is not None and live:
+        interval = min(interval, max(next_ko - now, LIVE_POLL_FAST_SECONDS))
+
+    # الميزانية: كل دورة ≈ طلب live + طلبات التفاصيل (أسوأ حالة: كل المباريات على دفعات ids)
+    remaining = daily_budget - calls_today
+    end_of_day = datetime.fromtimestamp(now, timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    ) + timedelta(days=1)
+    seconds_left = end_of_day.timestamp() - now
+    if remaining <= 0:
+        return max(interval, min(seconds_left, IDLE_POLL_MAX_SECONDS))
+    per_tick = calls_per_tick if calls_per_tick is not None else \
+        1 + -(-len(live) // FIXTURE_IDS_BATCH)
+    budget_floor = seconds_left * per_tick / remaining
+    return max(interval, budget_floor)
+
+
+FINISHED_STATUSES = {"FT", "AET", "PEN"}
+
+
+def needs_events_fetch(fx: FixtureRecord, now: float) -> bool:
+    """
+    هل تغيّر ملخص المباراة بما يوحي بأحداث جديدة؟
+    (أول ظهور، تغيّر النتيجة أو الحالة، فترة متابعة بعد تغيير، أو تحديث أمان دوري)
+    """
+    fixture_id = fx.id
+    prev = live_state.get(fixture_id)
+    if not prev:
+        return True
+    status_short = fx.status_short
+    if status_short in FINISHED_STATUSES and status_short == prev["status"]:
+        # الفهرس يُحرَّر بعد آخر جلب ناجح في النهاية؛ بقاؤه يعني أن الجلب الأخير لم يتم
+        return fixture_id in event_index
+    if fixture_id not in events_checked_at:
+        return True
+    if (fx.goals_home, fx.goals_away, status_short) != (
+        prev["score_home"], prev["score_away"], prev["status"]
+    ):
+        return True
+    if now < events_hot_until.get(fixture_id, 0):
+        return True
+    return now - events_checked_at[fixture_id] >= EVENTS_SAFETY_REFRESH_SECONDS
+
+
+EVENT_TYPE_CODES = {"Goal": 1, "Card": 2, "subst": 3, "Var": 4}
+EVENT_KINDS = {1: "goal", 2: "card", 3: "subst", 4: "goal"}
+
+
+def event_hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(),
+                          "big", signed=True)
+
+
+def event_ident(ev_type: str | None, away: bool, key: str, nth: int) -> int:
+    """
+    هوية الحدث من حقول ثابتة: النوع + الفريق + اللاعب (key) + ترتيبه بين الأحداث
+    المتطابقة في هذه الثلاثة فقط. آخر 4 بتات رمز النوع والبت الخامس جهة الفريق
+    (مضيف/ضيف)، فيُعرف نوع وجهة الحدث المحذوف دون الرجوع للقائمة القديمة.
+    """
+    ident = event_hash("%s|%s|%d" % (ev_type, key, nth)) & ~0x1F
+    return ident | (0x10 if away else 0) | EVENT_TYPE_CODES.get(ev_type, 0)
+
+
+def event_identities(events: list[dict], away_id: int | None,
+                     index: dict | None = None) -> list[tuple[int, int, dict]]:
+    """
+    (هوية، بصمة المحتوى، الحدث) بترتيب القائمة. البصمة = التفصيل + صاحب التمريرة.
+    الأحداث المتطابقة (نفس النوع والفريق واللاعب) تُطابق مع الفهرس بالمحتوى أولاً
+    ثم بالترتيب، فإدراج حدث متأخر أو تبديل ترتيب حدثين لا يغيّر هوية ما نُشر.
+    """
+    index = index or {}
+    groups: dict[tuple, list[int]] = {}
+    contents = []
+    for i, ev in enumerate(events):
+        team_id = (ev.get("team") or {}).get("id")
+        key = "%s|%s" % (team_id, (ev.get("player") or {}).get("id"))
+        away = team_id is not None and team_id == away_id
+        groups.setdefault((ev.get("type"), away, key), []).append(i)
+        contents.append(event_hash("%s|%s" % (ev.get("detail"),
+                                              (ev.get("assist") or {}).get("id"))))
+
+    # خانات الفهرس لكل ثلاثية: بعد حذف حدث قد لا تكون متتالية، فنفحص حتى عدد
+    # الأحداث + عدد ما في الفهرس من نفس النوع والجهة
+    per_slot = Counter(ident & 0x1F for ident in index)
+    idents = [0] * len(events)
+    for (ev_type, away, key), members in groups.items():
+        candidates = [event_ident(ev_type, away, key, k) for k in range(
+            len(members) + per_slot[event_ident(ev_type, away, key, 0) & 0x1F])]
+        free = [ident for ident in candidates if ident in index]
+        rest = []
+        for i in members:
+            # نفس المحتوى في خانة قديمة = نفس الحدث
+            ident = next((ident for ident in free if index[ident] == contents[i]), None)
+            if ident is None:
+                rest.append(i)
+            else:
+                free.remove(ident)
+                idents[i] = ident
+        unused = (ident for ident in candidates if ident not in index)
+        for i in rest:
+            idents[i] = free.pop(0) if free else next(unused)
+    return [(idents[i], contents[i], ev) for i, ev in enumerate(events)]
 
+
+def is_goal_cancelled(ev: dict) -> bool:
+    return ev.get("type") == "Var" and "goal cancelled" in (ev.get("detail") or "").lower()
+
+
+def format_event_base(ev: dict) -> str:
+    minute = (ev.get("time") or {}).get("elapsed")
+    team_name = (ev.get("team") or {}).get("name", "")
+    player = (ev.get("player") or {}).get("name", "")
+    assist = (ev.get("assist") or {}).get("name", "")
+    base = f"⏱ {minute}' • {team_name}\n👤 {player}"
+    if assist:
+        base += f" (🎯 تمريرة: {assist})"
+    return base
+
+
+def diff_fixture_events(fx: FixtureRecord, events: list[dict]):
+    """
+    مقارنة قائمة الأحداث بفهرس المباراة:
+    جديد → تنبيه، تغيّر تفصيله → تصحيح، حدث حُذف وحلّ محله حدث من نفس النوع
+    والجهة (تغيير اللاعب مثلاً) → تصحيح، نقص أهداف فريق → إلغاء هدف (إلا إذا أعلنه
+    حدث VAR "Goal cancelled" في نفس الجلب). تعديل الدقيقة أو الترتيب لا يعيد النشر.
+    """
+    fixture_id = fx.id
+    index = event_index.setdefault(fixture_id, {})
+    baseline = fixture_id in event_baseline
+    event_baseline.discard(fixture_id)
+    current = event_identities(events, fx.away_id, index)
+
+    goal = EVENT_TYPE_CODES["Goal"]
+    present = {ident for ident, _, _ in current}
+    if current:
+        removed = [ident for ident in index if ident not in present]
+    elif not (fx.goals_home or fx.goals_away):
+        # قائمة فارغة والنتيجة 0-0: أي هدف في الفهرس أُلغي فعلاً
+        removed = [ident for ident in index if ident & 0xF == goal]
+    else:
+        # المزود يرجع أحياناً قائمة فارغة مؤقتاً؛ لا نعتبرها حذفاً
+        removed = []
+    replaced = Counter(ident & 0x1F for ident in removed)   # (الجهة | النوع) -> عدد
+    cancelled = Counter()
+
+    for ident, content, ev in current:
+        old = index.get(ident)
+        if old == content:
+            continue
+        index[ident] = content
+        if state_store:
+            state_store.set_event(fixture_id, ident, content)
+        if baseline:
+            continue
+        slot = ident & 0x1F
+        if old is None and replaced[slot]:
+            # حدث حُذف وحلّ محله آخر من نفس النوع والجهة: تصحيح وليس حدثاً جديداً
+            replaced[slot] -= 1
+        elif old is None:
+            publish_event_alert(fx, ev)
+            if is_goal_cancelled(ev):
+                cancelled[slot & 0x10] += 1
+            continue
+        publish_alert(fx, EVENT_KINDS.get(ident & 0xF, "card"),
+                      f"✏️ <b>تصحيح: {ev.get('detail', '')}</b>\n{format_event_base(ev)}")
+
+    if not removed:
+        return
+    for ident in removed:
+        del index[ident]
+    if state_store:
+        state_store.remove_events(fixture_id, removed)
+    if baseline:
+        return
+    for side in (0, 0x10):
+        for _ in range(replaced[side | goal] - cancelled[side]):
+            publish_alert(fx, "goal", "❌ <b>إلغاء هدف بعد المراجعة (VAR)</b>\n"
+                          + format_live_header(fx), PRIORITY_HIGH)
+
+
+def publish_event_alert(fx: FixtureRecord, ev: dict):
+    ev_type = ev.get("type")
+    detail = ev.get("detail") or ""
+    base = format_event_base(ev)
+    if ev_type == "Goal":
+        publish_alert(fx, "goal", f"⚽️ <b>هدف!</b>\n{base}", PRIORITY_HIGH)
+    elif ev_type == "Card":
+        if "Yellow" in detail:
+            msg = f"🟨 <b>بطاقة صفراء</b>\n{base}"
+        elif "Red" in detail:
+            msg = f"🟥 <b>بطاقة حمراء</b>\n{base}"
+        else:
+            msg = f"🟧 <b>بطاقة</b>\n{base} • {detail}"
+        publish_alert(fx, "card", msg, PRIORITY_NORMAL)
+    elif ev_type == "subst":
+        publish_alert(fx, "subst", f"🔁 <b>تبديل</b>\n{base}", PRIORITY_LOW)
+    elif ev_type == "Var":
+        publish_alert(fx, "goal", f"📺 <b>VAR: {detail}</b>\n{base}", PRIORITY_HIGH)
+
+
+def process_live_fixtures() -> float:
+    """دورة لايف واحدة. يرجع موعد الدورة القادمة بالثواني."""
+    start = time.perf_counter()
+    try:
+        if shard_coordinator:
+            return shard_coordinator.tick()
+        return _process_live_tick()
+    finally:
+        live_tick_duration.observe(time.perf_counter() - start)
+
+
+def _process_live_tick() -> float:
+    global live_fixtures
     live = fetch_live_fixtures()
+    live_fixtures = live
     if not live:
         print("لا توجد مباريات جارية الآن.")
-        return
+    if not live and not live_records:
+        expire_old_fixtures()
+        return next_live_poll_interval([], upcoming_kickoffs(), *quota_governor.daily_state())
+
+    calls = process_live_batch(live, time.time())
+    return next_live_poll_interval(
+        live, upcoming_kickoffs(), *quota_governor.daily_state(), calls_per_tick=1 + calls,
+    )
 
-    for fx in live:
-        f = fx["fixture"]
-        fixture_id = f["id"]
 
-        # تنبيهات قبل المباراة
-        check_and_send_pre_match_alerts(fx)
+def process_live_batch(live: list[FixtureRecord], now: float) -> int:
+    """
+    اكتشاف التغييرات وإرسال التنبيهات لمجموعة مباريات لايف (كلها أو نصيب shard منها).
+    يرجع عدد طلبات الأحداث/الإحصائيات التي احتاجتها.
+    """
+    global live_state
+
+    # جلب الأحداث بالتوازي للمباريات التي تغيّر ملخصها فقط، وإحصائيات ما وصل للاستراحة
+    # المفضلة أولاً حتى تحصل على الحصة قبل غيرها
+    changed = sorted(
+        (fx for fx in live if needs_events_fetch(fx, now)), key=events_priority
+    )
+    # مباراة متابعة اختفت من live=all انتهت غالباً (الرد لا يحمل المنتهية):
+    # جلب أخير بالـ ids لحالتها ونتيجتها وأحداثها، ثم يُحرَّر فهرسها
+    live_ids = {fx.id for fx in live}
+    gone = [fx for fid, fx in live_records.items() if fid not in live_ids]
+    changed += gone
+    fixture_ids = [fx.id for fx in changed]
+    ht_fixtures = [
+        fx for fx in live
+        if fx.status_short == "HT" and live_state.get(fx.id, {}).get("status", "HT") != "HT"
+    ]
+    # طلب ids واحد لكل 20 مباراة يجمع الأحداث والإحصائيات معاً
+    changed_ids = set(fixture_ids)
+    need = changed + [fx for fx in ht_fixtures if fx.id not in changed_ids]
+    details, calls = fetch_details_batched(sorted(need, key=events_priority))
+    events_by_fixture = {
+        fid: details[fid]["events"] if fid in details else None for fid in fixture_ids
+    }
+    stats_by_fixture = {
+        fx.id: details[fx.id]["statistics"] for fx in ht_fixtures if fx.id in details
+    }
+    for fixture_id, events in events_by_fixture.items():
+        if events is not None:
+            events_checked_at[fixture_id] = now
+    # الغائبة التي فشل جلبها تبقى في live_records وتُعاد في الدورة القادمة
+    final = [details[fx.id]["fixture"] for fx in gone if fx.id in details]
+    final_ids = {fx.id for fx in final}
+
+    for fx in live + final:
+        fixture_id = fx.id
+        live_seen_at[fixture_id] = now
 
         prev = live_state.get(fixture_id)
-        goals = fx["goals"]
-        score_home = goals["home"]
-        score_away = goals["away"]
-        status_short = f["status"]["short"]  # "1H", "HT", "2H", "FT"...
+        score_home = fx.goals_home
+        score_away = fx.goals_away
+        status_short = fx.status_short  # "1H", "HT", "2H", "FT"...
 
         # أول مرة نرى المباراة لايف
         if not prev:
             header = format_live_header(fx)
             if is_favorite_match(fx):
-                tg_send_message("🎬 <b>انطلاق مباراة مهمة لفِرقك المفضلة!</b>\n" + header)
+                publish_alert(fx, "kickoff",
+                              "🎬 <b>انطلاق مباراة مهمة لفِرقك المفضلة!</b>\n" + header)
             else:
-                tg_send_message("🎬 <b>انطلاق مباراة</b>\n" + header)
+                publish_alert(fx, "kickoff", "🎬 <b>انطلاق مباراة</b>\n" + header)
 
             live_state[fixture_id] = {
                 "score_home": score_home,
@@ -542,130 +2815,494 @@ def process_live_fixtures():
                 "status": status_short,
             }
         else:
-            # تغيير في النتيجة (هدف)
+            # تغيير في النتيجة: هدف فقط إن زاد رصيد أحد الفريقين؛ النقص (إلغاء بالـ VAR)
+            # يعلنه diff_fixture_events من قائمة الأحداث
             if score_home != prev["score_home"] or score_away != prev["score_away"]:
-                header = format_live_header(fx)
-                if is_favorite_match(fx):
-                    tg_send_message("⚽️ <b>هدف في مباراة فريقك المفضل!</b>\n" + header)
-                else:
-                    tg_send_message("⚽️ <b>هدف جديد!</b>\n" + header)
+                if (score_home or 0) > (prev["score_home"] or 0) or \
+                        (score_away or 0) > (prev["score_away"] or 0):
+                    header = format_live_header(fx)
+                    if is_favorite_match(fx):
+                        publish_alert(fx, "goal",
+                                      "⚽️ <b>هدف في مباراة فريقك المفضل!</b>\n" + header,
+                                      PRIORITY_HIGH)
+                    else:
+                        publish_alert(fx, "goal", "⚽️ <b>هدف جديد!</b>\n" + header, PRIORITY_HIGH)
 
                 prev["score_home"] = score_home
                 prev["score_away"] = score_away
+                events_hot_until[fixture_id] = now + EVENTS_HOT_SECONDS
 
             # تغيير حالة المباراة
             if status_short != prev["status"]:
                 header = format_live_header(fx)
                 if status_short == "HT":
-                    tg_send_message("⏸ <b>نهاية الشوط الأول</b>\n" + header)
+                    publish_alert(fx, "status", "⏸ <b>نهاية الشوط الأول</b>\n" + header)
                     try:
-                        stats = fetch_fixture_stats(fixture_id)
+                        stats = stats_by_fixture.get(fixture_id) or []
                         stats_txt = format_half_stats(stats)
-                        tg_send_message(stats_txt)
+                        publish_alert(fx, "stats", stats_txt)
                     except Exception as e:
                         print("Stats error:", e)
                 elif status_short == "FT":
-                    tg_send_message("🏁 <b>نهاية المباراة</b>\n" + header)
+                    publish_alert(fx, "status", "🏁 <b>نهاية المباراة</b>\n" + header, PRIORITY_HIGH)
                 else:
-                    tg_send_message("🔄 <b>تحديث حالة المباراة</b>\n" + header)
+                    publish_alert(fx, "status", "🔄 <b>تحديث حالة المباراة</b>\n" + header)
+
+                if status_short in FINISHED_STATUSES and state_store:
+                    # نتائج محلية لملاءمة تقييمات التوقع (refit_ratings)
+                    state_store.add_result(fx)
 
                 prev["status"] = status_short
+                events_hot_until[fixture_id] = now + EVENTS_HOT_SECONDS
 
-        # أحداث التفاصيل: أهداف، بطاقات، تبديلات
-        events = fetch_fixture_events(fixture_id)
-        for ev in events:
-            key = (
-                f"{fixture_id}-"
-                f"{ev.get('time', {}).get('elapsed')}-"
-                f"{ev.get('team', {}).get('id')}-"
-                f"{ev.get('player', {}).get('id')}-"
-                f"{ev.get('type')}-"
-                f"{ev.get('detail')}"
-            )
-            if key in seen_events:
-                continue
-            seen_events.add(key)
-
-            ev_type = ev.get("type")
-            detail = ev.get("detail", "")
-            minute = ev.get("time", {}).get("elapsed")
-            team_name = ev.get("team", {}).get("name", "")
-            player = ev.get("player", {}).get("name", "")
-            assist = ev.get("assist", {}).get("name", "")
-
-            base = f"⏱ {minute}' • {team_name}\n👤 {player}"
-            if assist:
-                base += f" (🎯 تمريرة: {assist})"
-
-            if ev_type == "Goal":
-                msg = f"⚽️ <b>هدف!</b>\n{base}"
-                tg_send_message(msg)
-            elif ev_type == "Card":
-                if "Yellow" in detail:
-                    msg = f"🟨 <b>بطاقة صفراء</b>\n{base}"
-                elif "Red" in detail:
-                    msg = f"🟥 <b>بطاقة حمراء</b>\n{base}"
-                else:
-                    msg = f"🟧 <b>بطاقة</b>\n{base} • {detail}"
-                tg_send_message(msg)
-            elif ev_type == "subst":
-                msg = f"🔁 <b>تبديل</b>\n{base}"
-                tg_send_message(msg)
+        if state_store:
+            state_store.save_fixture(fixture_id, live_state[fixture_id], now)
+
+        # أحداث التفاصيل: أهداف، بطاقات، تبديلات، VAR
+        # None = لم يصل الرد ضمن المهلة؛ نعيد المحاولة في الدورة القادمة
+        events = events_by_fixture.get(fixture_id)
+        if events is None:
+            continue
+        diff_fixture_events(fx, events)
+        if status_short in FINISHED_STATUSES or fixture_id in final_ids:
+            # آخر جلب بعد النهاية: الفهرس كله يُحرَّر مرة واحدة
+            event_index.pop(fixture_id, None)
+            if state_store:
+                state_store.free_events(fixture_id)
+            if status_short not in FINISHED_STATUSES:
+                # لم تنتهِ فعلاً (توقف/تأجيل): لو عادت للايف لا نعيد نشر أحداثها
+                event_baseline.add(fixture_id)
+
+    for fx in live:
+        live_records[fx.id] = fx
+    for fixture_id in final_ids:
+        live_records.pop(fixture_id, None)
+
+    if state_store:
+        if outbox_spool:
+            # وضع shards: الرسائل تُحفظ في نفس معاملة event_index (إما الاثنان أو لا شيء)
+            state_store.spool_messages(outbox_spool)
+            outbox_spool.clear()
+        state_store.commit()
+    expire_old_fixtures(now)
+
+    return calls
 
 
 # ============================
-#   حلقة التشغيل الرئيسية
+#   تقسيم اللايف على عمليات (shards)
 # ============================
 
-def run_loop():
-    print("🚀 F90 Sports Live Bot started...")
-    last_schedule = 0
-    last_topscorers = 0
-    last_match_of_week = 0
-    last_favorites = 0
+def shard_of(fx: FixtureRecord, shards: int) -> int:
+    key = fx.league_id if LIVE_SHARD_KEY == "league" else fx.id
+    return (key or 0) % shards
+
 
+def shard_worker_main(shard: int, shards: int, tasks, results, db_path: str):
+    """
+    عملية shard: تستقبل مبارياتها من المنسق كل دورة، تجلب أحداثها وتكتشف التغييرات،
+    وتكتب رسائلها لجدول outbox. لو فشلت الدورة تُلغى المعاملة وتُعاد الحالة من
+    التخزين، فتُعالج نفس الأحداث في الدورة القادمة بدل أن تضيع.
+    """
+    global outbox_spool
+    init_state(db_path)
+    quota_governor.share = 1.0 / shards
+    outbox_spool = []
     while True:
-        now = time.time()
+        task = tasks.get()
+        if task is None:
+            return
+        tick, live, now = task
+        try:
+            calls = process_live_batch(live, now)
+            results.put((shard, tick, calls, None))
+        except Exception as e:
+            state_store.rollback()
+            outbox_spool.clear()
+            load_state()
+            results.put((shard, tick, 0, repr(e)))
 
-        # 1) جدول عام للمباريات القادمة
-        if now - last_schedule > SCHEDULE_EVERY_SECONDS:
-            try:
-                send_global_schedule()
-            except Exception as e:
-                print("Schedule error:", e)
-            last_schedule = now
 
-        # 2) جدول خاص للفرق الكبيرة
-        if now - last_favorites > FAVORITES_EVERY_SECONDS:
-            try:
-                send_favorites_schedule()
-            except Exception as e:
-                print("Favorites error:", e)
-            last_favorites = now
+class ShardCoordinator:
+    """
+    المنسق: يملك طلب live=all الوحيد ويوزع المباريات على عمليات shards (حسب
+    رقم المباراة أو الدوري)، ثم ينقل رسائلها من جدول outbox لطابور تلجرام الوحيد
+    حتى يبقى حد الإرسال مشتركاً. عملية متوقفة أو عالقة يُعاد تشغيلها وتكمل من
+    حالة SQLite المشتركة.
+    """
 
-        # 3) هدافين الدوريات
-        if now - last_topscorers > TOPSCORERS_EVERY_SECONDS:
+    def __init__(self, shards: int, db_path: str = STATE_DB_PATH):
+        self.shards = shards
+        self.db_path = db_path
+        self._ctx = multiprocessing.get_context("spawn")
+        self._results = self._ctx.Queue()
+        self._workers: list = [None] * shards
+        self._tasks: list = [None] * shards
+        self._tick = 0
+        self.restarts = 0
+        self.errors = 0
+
+    def _ensure_worker(self, shard: int):
+        proc = self._workers[shard]
+        if proc is not None and proc.is_alive():
+            return
+        if proc is not None:
+            self.restarts += 1
+            print(f"⚠️ shard {shard} توقف (exit {proc.exitcode})؛ إعادة تشغيل.")
+        tasks = self._ctx.Queue()
+        proc = self._ctx.Process(
+            target=shard_worker_main,
+            args=(shard, self.shards, tasks, self._results, self.db_path),
+            name=f"live-shard-{shard}", daemon=True,
+        )
+        proc.start()
+        self._workers[shard], self._tasks[shard] = proc, tasks
+
+    def drain_outbox(self) -> int:
+        rows = state_store.take_outbox() if state_store else []
+        for text, priority, fixture_id, chat_id in rows:
+            outbox_for(chat_id).enqueue(text, priority=priority, fixture_id=fixture_id)
+        return len(rows)
+
+    def tick(self) -> float:
+        global live_fixtures
+        # رسائل دورة سابقة وصل تأكيدها بعد المهلة
+        self.drain_outbox()
+        live = fetch_live_fixtures()
+        live_fixtures = live
+        if not live:
+            print("لا توجد مباريات جارية الآن.")
+        now = time.time()
+        self._tick += 1
+        parts: list[list[FixtureRecord]] = [[] for _ in range(self.shards)]
+        for fx in live:
+            parts[shard_of(fx, self.shards)].append(fx)
+        for shard in range(self.shards):
+            self._ensure_worker(shard)
+            self._tasks[shard].put((self._tick, parts[shard], now))
+
+        calls = 0
+        pending = set(range(self.shards))
+        deadline = time.time() + SHARD_ACK_TIMEOUT_SECONDS
+        while pending:
             try:
-                send_top_scorers()
-            except Exception as e:
-                print("Topscorers error:", e)
-            last_topscorers = now
+                shard, tick, n, error = self._results.get(
+                    timeout=max(deadline - time.time(), 0.01)
+                )
+            except Empty:
+                break
+            if tick != self._tick:
+                continue
+            pending.discard(shard)
+            calls += n
+            if error:
+                self.errors += 1
+                print(f"Shard {shard} error:", error)
+        for shard in pending:
+            # عالق: نوقفه فتُلغى معاملته غير المكتملة، ويُعاد تشغيله في الدورة القادمة
+            print(f"⚠️ shard {shard} تجاوز مهلة {SHARD_ACK_TIMEOUT_SECONDS} ثانية.")
+            self._workers[shard].terminate()
+            self._workers[shard].join(5)
+
+        self.drain_outbox()
+        expire_old_fixtures(now)
+        return next_live_poll_interval(
+            live, upcoming_kickoffs(), *quota_governor.daily_state(), calls_per_tick=1 + calls,
+        )
+
+    def stop(self):
+        for shard, proc in enumerate(self._workers):
+            if proc is not None and proc.is_alive():
+                self._tasks[shard].put(None)
+                proc.join(5)
+
+    def snapshot(self) -> dict:
+        return {
+            "shards": self.shards,
+            "key": LIVE_SHARD_KEY,
+            "alive": sum(1 for p in self._workers if p is not None and p.is_alive()),
+            "ticks": self._tick,
+            "restarts": self.restarts,
+            "errors": self.errors,
+        }
 
-        # 4) مباراة الأسبوع
-        if now - last_match_of_week > MATCH_OF_WEEK_EVERY_SECONDS:
-            try:
-                send_match_of_week()
-            except Exception as e:
-                print("Match-of-week error:", e)
-            last_match_of_week = now
 
-        # 5) بث لايف دائم
+shard_coordinator: ShardCoordinator | None = None
+
+
+# ============================
+#   حلقة التشغيل الرئيسية
+# ============================
+
+class Job:
+    """مهمة دورية: موعدها القادم + آخر مدة تشغيل."""
+
+    def __init__(self, name: str, func, interval: float, deadline: float, jitter: float = 0.0,
+                 adaptive: bool = False):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.adaptive = adaptive         # func ترجع موعد التشغيل القادم بنفسها
+        self.deadline = deadline
+        self.jitter = jitter
+        self.slot = time.time()          # الموعد بدون تذبذب (يمنع انجراف الإيقاع)
+        self.next_run = self.slot
+        self.last_run: float | None = None
+        self.last_duration: float | None = None
+        self.last_error: str | None = None
+        self.running = False
+        self.runs = 0
+        self.skipped = 0
+        self.overruns = 0
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        running_for = now - self.last_run if self.running and self.last_run else None
+        return {
+            "name": self.name,
+            "interval": self.interval,
+            "deadline": self.deadline,
+            "next_run": datetime.fromtimestamp(self.next_run, timezone.utc).isoformat(),
+            "next_run_in": round(self.next_run - now, 1),
+            "last_run": (
+                datetime.fromtimestamp(self.last_run, timezone.utc).isoformat()
+                if self.last_run else None
+            ),
+            "last_duration": round(self.last_duration, 3) if self.last_duration is not None else None,
+            "running": self.running,
+            "overdue": running_for is not None and running_for > self.deadline,
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "overruns": self.overruns,
+            "last_error": self.last_error,
+        }
+
+
+class JobScheduler:
+    """
+    مُجدول بطابور أولويات (heap) حسب موعد التشغيل.
+    كل مهمة تعمل على عامل مستقل، فلا تؤخر مهمة بطيئة فحص اللايف،
+    والمواعيد ثابتة الإيقاع (slot + interval) بدل sleep بعد العمل.
+    """
+
+    def __init__(self):
+        self.jobs: dict[str, Job] = {}
+        self._heap: list = []            # (next_run, seq, job)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._pool: ThreadPoolExecutor | None = None
+
+    def add(self, job: Job):
+        last = state_store.get_json(f"job_last_run:{job.name}") if state_store else None
+        if last and not job.adaptive:
+            # بعد إعادة التشغيل نكمل من آخر تشغيل ناجح بدل إعادة كل المهام فوراً
+            job.slot = job.next_run = last + job.interval
+        with self._cond:
+            self.jobs[job.name] = job
+            heapq.heappush(self._heap, (job.next_run, next(self._seq), job))
+            self._cond.notify()
+
+    def _reschedule(self, job: Job, delay: float | None = None):
+        now = time.time()
+        job.slot += job.interval if delay is None else delay
+        if job.slot < now:
+            if job.adaptive:
+                # تشغيل أطول من الموعد الذي طلبه: نعيده فوراً بدل القفز بمضاعفات interval
+                job.slot = now
+            else:
+                # فاتتنا مواعيد (توقف طويل)؛ نقفز للموعد القادم بدل تشغيلها متتالية
+                job.slot += ((now - job.slot) // job.interval + 1) * job.interval
+        job.next_run = job.slot + (random.uniform(0, job.jitter) if job.jitter else 0.0)
+        heapq.heappush(self._heap, (job.next_run, next(self._seq), job))
+
+    def _execute(self, job: Job):
+        start = time.time()
+        delay = None
         try:
-            process_live_fixtures()
+            result = job.func()
+            if job.adaptive and isinstance(result, (int, float)) and result > 0:
+                delay = float(result)
+            job.last_error = None
+            if state_store and not job.adaptive:
+                state_store.set_json(f"job_last_run:{job.name}", start)
         except Exception as e:
-            print("Live processing error:", e)
+            job.last_error = str(e)
+            print(f"{job.name} error:", e)
+        finally:
+            job.last_duration = time.time() - start
+            job.runs += 1
+            job.running = False
+            if job.last_duration > job.deadline:
+                job.overruns += 1
+                print(f"⚠️ المهمة {job.name} تجاوزت مهلتها ({job.last_duration:.1f}s > {job.deadline}s).")
+            if job.adaptive:
+                # الموعد القادم يُحسب من بداية هذا التشغيل (بدون انجراف)
+                with self._cond:
+                    job.slot = start
+                    self._reschedule(job, delay)
+                    self._cond.notify()
+
+    def run_forever(self):
+        self._pool = ThreadPoolExecutor(max_workers=max(1, len(self.jobs)), thread_name_prefix="job")
+        while True:
+            with self._cond:
+                while True:
+                    now = time.time()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    timeout = self._heap[0][0] - now if self._heap else None
+                    self._cond.wait(timeout=timeout)
+                _, _, job = heapq.heappop(self._heap)
+
+                if job.running:
+                    # التشغيل السابق لم ينتهِ؛ لا نكدّس نسخاً من نفس المهمة
+                    job.skipped += 1
+                else:
+                    job.running = True
+                    job.last_run = time.time()
+                    self._pool.submit(self._execute, job)
+                    if job.adaptive:
+                        continue   # تُجدول بعد انتهائها
+                self._reschedule(job)
+
+    def snapshot(self) -> list[dict]:
+        with self._cond:
+            jobs = sorted(self.jobs.values(), key=lambda j: j.next_run)
+        return [j.snapshot() for j in jobs]
+
+
+scheduler = JobScheduler()
+
+
+def register_jobs(sched: JobScheduler):
+    bg = BACKGROUND_JOB_DEADLINE_SECONDS
+    jitter = BACKGROUND_JOB_JITTER_SECONDS
+    # 1) بث لايف دائم – إيقاعه لا يتأثر بمهام الخلفية
+    sched.add(Job("live", process_live_fixtures, LIVE_POLL_SECONDS,
+                  deadline=LIVE_POLL_SECONDS, adaptive=True))
+    # 2) جدول عام للمباريات القادمة
+    sched.add(Job("schedule", send_global_schedule, SCHEDULE_EVERY_SECONDS, bg, jitter))
+    # 3) جدول خاص للفرق الكبيرة
+    sched.add(Job("favorites", send_favorites_schedule, FAVORITES_EVERY_SECONDS, bg, jitter))
+    # 4) هدافين الدوريات
+    sched.add(Job("topscorers", send_top_scorers, TOPSCORERS_EVERY_SECONDS, bg, jitter))
+    # 5) مباراة الأسبوع
+    sched.add(Job("match_of_week", send_match_of_week, MATCH_OF_WEEK_EVERY_SECONDS, bg, jitter))
+
 
-        time.sleep(LIVE_POLL_SECONDS)
+def run_loop():
+    global shard_coordinator
+    print("🚀 F90 Sports Live Bot started...")
+    init_state()
+    if LIVE_SHARDS > 1:
+        shard_coordinator = ShardCoordinator(LIVE_SHARDS)
+        print(f"🧩 اللايف مقسم على {LIVE_SHARDS} عمليات حسب {LIVE_SHARD_KEY}.")
+    register_jobs(scheduler)
+    scheduler.run_forever()
+
+
+# ============================
+#   أوامر تلجرام (Webhook)
+# ============================
+# الردود من الذاكرة فقط (live_fixtures والكاش) بدون أي طلب لـ API-FOOTBALL،
+# وتُرسل في رد الـ webhook نفسه فلا تنتظر تلجرام ولا تلمس حلقة اللايف.
+
+COMMAND_MAX_ITEMS = 10
+
+
+def command_live(arg: str) -> str:
+    live = list(live_fixtures)
+    if not live:
+        return "لا توجد مباريات جارية الآن."
+    blocks = ["🔴 <b>المباريات الجارية الآن</b>\n"]
+    blocks += [format_live_header(fx) + "\n" for fx in sorted(live, key=events_priority)]
+    messages = pack_messages(blocks, TG_MESSAGE_LIMIT - 64)   # مساحة لسطر "و N أخرى"
+    if len(messages) > 1:
+        shown = messages[0].count("🔢")
+        messages[0] += f"\n… و{len(live) - shown} مباراة أخرى."
+    return messages[0]
+
+
+def command_next(arg: str) -> str:
+    query = arg.strip()
+    if not query:
+        return "اكتب اسم الفريق: /next Real Madrid"
+    canonical = (favorite_index.search(query) or query).lower()
+    now = time.time()
+    found = sorted(
+        (
+            fx for fx in cached_fixtures()
+            if fx.kickoff and fx.kickoff > now
+            and (canonical in fx.home_name.lower() or canonical in fx.away_name.lower())
+        ),
+        key=lambda fx: fx.kickoff,
+    )[:COMMAND_MAX_ITEMS // 2]
+    if not found:
+        return f"لا توجد مباريات قادمة محفوظة لـ {html.escape(query)} حالياً."
+    lines = [f"📆 <b>مباريات {html.escape(query)} القادمة</b>\n"]
+    for fx in found:
+        lines.append(f"🏟 {fx.home_name} vs {fx.away_name}\n"
+                     f"🏆 {fx.league_name}\n"
+                     f"⏰ {utc_to_local_str(fx.date)}\n")
+    return "\n".join(lines)
+
+
+def command_scorers(arg: str) -> str:
+    query = arg.strip().lower()
+    for data in api_cache.scan("/players/topscorers"):
+        resp = data.get("response", [])
+        if not resp:
+            continue
+        league = resp[0]["statistics"][0]["league"]
+        if query and query != str(league.get("id")) and query not in (league.get("name") or "").lower():
+            continue
+        lines = [f"⚽️ <b>هدافو {league.get('name')}</b>"]
+        for i, p in enumerate(resp[:COMMAND_MAX_ITEMS], start=1):
+            st = p["statistics"][0]
+            lines.append(f"{i}. {p['player']['name']} ({st['team']['name']}) – {st['goals']['total']} هدف")
+        return "\n".join(lines)
+    return "لا توجد قائمة هدافين محفوظة لهذا الدوري حالياً. جرّب: /scorers Premier League"
+
+
+def command_help(arg: str) -> str:
+    return (
+        "🤖 <b>أوامر F90 Sports</b>\n"
+        "/live – المباريات الجارية الآن\n"
+        "/next &lt;فريق&gt; – مباريات فريق القادمة\n"
+        "/scorers &lt;دوري&gt; – هدافو الدوري"
+    )
+
+
+COMMANDS = {
+    "/live": command_live,
+    "/next": command_next,
+    "/scorers": command_scorers,
+    "/start": command_help,
+    "/help": command_help,
+}
+
+
+def handle_command(text: str) -> tuple[str, str] | None:
+    """(اسم الأمر، الرد) أو None لو لم يكن النص أمراً معروفاً."""
+    if not text or not text.startswith("/"):
+        return None
+    head, _, arg = text.partition(" ")
+    name = head.split("@", 1)[0].lower()     # /live@F90Bot في المجموعات
+    handler = COMMANDS.get(name)
+    if not handler:
+        return None
+    return name, handler(arg)
+
+
+def register_webhook():
+    if not TG_WEBHOOK_URL:
+        return
+    resp = tg_api("setWebhook", {
+        "url": TG_WEBHOOK_URL,
+        "secret_token": TG_WEBHOOK_SECRET,
+        "allowed_updates": json.dumps(["message"]),
+    })
+    print("🔗 Telegram webhook:", "ok" if resp.get("ok") else resp.get("description"))
 
 
 # ============================
@@ -683,13 +3320,101 @@ def test():
     tg_send_message("✅ اختبار من بوت F90 Sports – إذا وصلتك هذه الرسالة فالبوت شغال.")
     return "Test message sent."
 
+@app.route("/stats")
+def stats():
+    return jsonify({
+        "http": http_stats_snapshot(),
+        "cache": api_cache.stats_snapshot(),
+        "telegram": tg_outbox.stats_snapshot(),
+        "channels": {chat_id: box.stats_snapshot() for chat_id, box in list(tg_outboxes.items())},
+        "quota": quota_governor.snapshot(),
+        "shards": shard_coordinator.snapshot() if shard_coordinator else None,
+        "kickoff_timers": kickoff_timers.snapshot(),
+        "media_cache": media_cache.stats_snapshot(),
+    })
+
+GaugeMetric("f90_fixtures_tracked", "Fixtures held in live_state",
+            provider=lambda: {(): len(live_state)})
+GaugeMetric("f90_seen_events", "Event identities held in the per-fixture event index",
+            provider=lambda: {(): sum(map(len, list(event_index.values())))})
+GaugeMetric(
+    "f90_api_quota", "API-FOOTBALL quota from x-ratelimit-* headers", ("window", "kind"),
+    provider=lambda: {
+        tuple(k.split("_")): v for k, v in api_quota.items()
+        if v is not None and k != "updated_at"
+    },
+)
+GaugeMetric("f90_api_calls_today", "API-FOOTBALL calls made today (UTC)",
+            provider=lambda: {(): api_calls_today()})
+GaugeMetric(
+    "f90_quota_decisions", "Quota governor decisions per request priority",
+    ("priority", "decision"),
+    provider=lambda: {
+        (str(p), decision): n
+        for decision, counts in quota_governor.snapshot().items()
+        if decision in ("granted", "deferred")
+        for p, n in enumerate(counts)
+    },
+)
+GaugeMetric("f90_http", "Shared HTTP session counters", ("counter",),
+            provider=lambda: {(k,): v for k, v in http_stats_snapshot().items()})
+GaugeMetric("f90_api_cache", "API response cache counters", ("counter",),
+            provider=lambda: {(k,): v for k, v in api_cache.stats_snapshot().items()})
+GaugeMetric(
+    "f90_telegram_outbox", "Telegram outbox counters per channel", ("chat", "counter"),
+    provider=lambda: {
+        (chat_id, k): v
+        for chat_id, box in list(tg_outboxes.items())
+        for k, v in box.stats_snapshot().items()
+    },
+)
+
+
+@app.route("/telegram", methods=["POST"])
+def telegram_webhook():
+    if TG_WEBHOOK_SECRET and (
+        flask_request.headers.get("X-Telegram-Bot-Api-Secret-Token") != TG_WEBHOOK_SECRET
+    ):
+        return "", 403
+    update = flask_request.get_json(silent=True) or {}
+    message = update.get("message") or {}
+    try:
+        handled = handle_command(message.get("text", ""))
+    except Exception as e:
+        print("Command error:", e)
+        handled = None
+    if not handled:
+        return jsonify({})
+    name, reply = handled
+    tg_commands.inc(command=name)
+    # الرد داخل رد الـ webhook: تلجرام ينفذه بدون طلب إضافي منا
+    return jsonify({
+        "method": "sendMessage",
+        "chat_id": message["chat"]["id"],
+        "text": reply,
+        "parse_mode": "HTML",
+        "reply_to_message_id": message.get("message_id"),
+    })
+
+@app.route("/metrics")
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/jobs")
+def jobs():
+    return jsonify(scheduler.snapshot())
+
 
 def run_flask():
     port = int(os.environ.get("PORT", 10000))
-    app.run(host="0.0.0.0", port=port)
+    # threaded: كل طلب webhook في خيط مستقل، والأوامر تقرأ الذاكرة فقط
+    app.run(host="0.0.0.0", port=port, threaded=True)
 
 
 if __name__ == "__main__":
-    import threading
-    threading.Thread(target=run_flask, daemon=True).start()
-    run_loop()
+    if "--fit-ratings" in sys.argv:
+        refit_ratings(backfill="--backfill" in sys.argv)
+    else:
+        threading.Thread(target=run_flask, daemon=True).start()
+        register_webhook()
+        run_loop()